@@ -10,7 +10,7 @@ from scipy import signal
 from feature_extraction import utils
 
 # from lib import utils
-from feature_extraction import features
+from feature_extraction import features, spectrogram_cache
 
 # import spectrum2scaletime, scaletime2scalerate, scalerate2cortical, waveform2auditoryspectrogram
 import matplotlib.pylab as plt
@@ -82,6 +82,25 @@ def load_strf_params(
     return strf_params
 
 
+def frame_aligned(duration, sr_time=250):
+    """
+    duration in seconds rounded to whole auditory spectrogram frames.
+    """
+    return round(duration * sr_time) / sr_time
+
+
+def load_wav2aud_params(sr_time=250, resampling_fs=16000):
+    wav2aud_params = {
+        "frame_length": 1000 / sr_time,  # sample rate 125 Hz in the NSL toolbox
+        "time_constant": 8,
+        "compression_factor": -2,
+        "octave_shift": math.log2(resampling_fs / resampling_fs),
+        "filt": "p",
+        "VERB": 0,
+    }
+    return wav2aud_params
+
+
 def spectrogram(
     wavtemp,
     audio_fs=44100,
@@ -90,12 +109,29 @@ def spectrogram(
     resampling_fs=16000,
     sr_time=250,
     offset=0.0,
+    num_threads=1,
 ):
     auditory_params = load_static_params()
     # resampling_fs = auditory_params['newFs']
     # duration = auditory_params['duration']
     # duration_cut_decay = auditory_params['duration_cut_decay']
     sr_time = auditory_params["sr_time"]
+
+    cache = spectrogram_cache.default_cache()
+    if cache is not None:
+        cache_params = {
+            "audio_fs": audio_fs,
+            "duration": duration,
+            "duration_cut_decay": duration_cut_decay,
+            "resampling_fs": resampling_fs,
+            "offset": offset,
+            **load_wav2aud_params(sr_time, resampling_fs),
+        }
+        cache_key = cache.key(wavtemp, cache_params)
+        auditory_spectrogram_ = cache.get(cache_key, cache_params)
+        if auditory_spectrogram_ is not None:
+            return auditory_spectrogram_
+
     wavtemp = np.r_[wavtemp, np.zeros(resampling_fs)]
     print(resampling_fs)
     if duration == -1:
@@ -124,21 +160,71 @@ def spectrogram(
     wavtemp = signal.resample(wavtemp, int(
         wavtemp.shape[0] / audio_fs * resampling_fs))
 
-    waveform2auditoryspectrogram_args = {
-        "frame_length": 1000 / sr_time,  # sample rate 125 Hz in the NSL toolbox
-        "time_constant": 8,
-        "compression_factor": -2,
-        "octave_shift": math.log2(resampling_fs / resampling_fs),
-        "filt": "p",
-        "VERB": 0,
-    }
+    waveform2auditoryspectrogram_args = load_wav2aud_params(sr_time, resampling_fs)
 
     auditory_spectrogram_ = features.waveform2auditoryspectrogram(
-        wavtemp, **waveform2auditoryspectrogram_args
+        wavtemp, **waveform2auditoryspectrogram_args, num_threads=num_threads
     )
+    if cache is not None:
+        cache.put(cache_key, cache_params, auditory_spectrogram_)
     return auditory_spectrogram_
 
 
+def recording_spectrograms(
+    wavtemp,
+    audio_fs=44100,
+    segment_duration=15,
+    resampling_fs=16000,
+    block_duration=1,
+    num_threads=1,
+):
+    """
+    Run the cochlear filterbank once over a whole recording and yield one
+    frame-aligned auditory spectrogram per full segment, as soon as its
+    frames are available.
+
+    Each block is scaled as if its segment had been peak-normalized before
+    filtering, which is exact because the linear (compression_factor=-2)
+    filterbank, rectifier and leaky integrator are positively homogeneous.
+    Unlike spectrogram(), segments do not get the cosine fade-out and the
+    filter state is carried over from the previous segment.
+    """
+    auditory_params = load_static_params()
+    sr_time = auditory_params["sr_time"]
+    if audio_fs != resampling_fs:
+        wavtemp = signal.resample(
+            wavtemp, int(wavtemp.shape[0] / audio_fs * resampling_fs)
+        )
+
+    wav2aud_params = load_wav2aud_params(sr_time, resampling_fs)
+    del wav2aud_params["filt"], wav2aud_params["VERB"]
+    stream = features.AuditorySpectrogramStream(
+        **wav2aud_params, num_threads=num_threads
+    )
+
+    segment_n = int(segment_duration * resampling_fs)
+    segment_frames = int(segment_duration * sr_time)
+    block_n = int(block_duration * resampling_fs)
+    num_segments = wavtemp.shape[0] // segment_n
+
+    pending = np.zeros((0, stream.M - 1))
+    try:
+        for k in range(num_segments):
+            segment = wavtemp[k * segment_n: (k + 1) * segment_n]
+            blocks = [pending] + [
+                stream.process(segment[i: i + block_n])
+                for i in range(0, segment_n, block_n)
+            ]
+            pending = np.concatenate(blocks)
+            auditory_spectrogram_ = pending[:segment_frames]
+            pending = pending[segment_frames:]
+
+            scale = 1 / 1.01 / (np.max(segment) + np.finfo(float).eps)
+            yield auditory_spectrogram_ * scale
+    finally:
+        stream.close()
+
+
 def spectrum(
     wavtemp,
     audio_fs=44100,
@@ -167,6 +253,13 @@ def mps(
     auditory_spectrogram_ = spectrogram(
         wavtemp, audio_fs, duration, duration_cut_decay, resampling_fs, sr_time, offset
     )
+    return mps_from_spectrogram(auditory_spectrogram_, sr_time)
+
+
+def mps_from_spectrogram(auditory_spectrogram_, sr_time=250):
+    """
+    Modulation power spectrum (rate x scale) of an auditory spectrogram.
+    """
     strf_args = {
         "num_channels": 128,
         "num_ch_oct": 24,
@@ -222,11 +315,28 @@ def strf(
         32,
     ],
     scales=[0.71, 1.0, 1.41, 2.00, 2.83, 4.00, 5.66, 8.00],
+    num_threads=1,
 ):
     auditory_spectrogram_ = spectrogram(
-        wavtemp, audio_fs, duration, duration_cut_decay, resampling_fs, sr_time, offset
+        wavtemp,
+        audio_fs,
+        duration,
+        duration_cut_decay,
+        resampling_fs,
+        sr_time,
+        offset,
+        num_threads,
     )
+    strf_, mod_scale, scale_rate = strf_from_spectrogram(
+        auditory_spectrogram_, sr_time, rates, scales
+    )
+    return strf_, auditory_spectrogram_, mod_scale, scale_rate
+
 
+def strf_from_spectrogram(auditory_spectrogram_, sr_time, rates, scales):
+    """
+    Modulation stages of strf() for an already computed auditory spectrogram.
+    """
     auditory_params = load_strf_params(rates, scales, sr_time)
     scales = auditory_params["scales"]
     rates = auditory_params["rates"]
@@ -260,7 +370,150 @@ def strf(
     )
     # print(strf_.shape)
     # num_ch_oct, sr_time, nfft_scale, nfft_rate, 2)
-    return strf_, auditory_spectrogram_, mod_scale, scale_rate
+    return strf_, mod_scale, scale_rate
+
+
+def strf_from_scaletime(scale_time, num_channels, sr_time, rates, scales):
+    """
+    Modulation stages of strf() after spectrum2scaletime, for the complex
+    scale-time representation of a (time, num_channels) spectrogram.
+    """
+    strf_args = {
+        "num_channels": num_channels,
+        "num_ch_oct": 24,
+        "sr_time": sr_time,
+        "nfft_rate": 2 * 2 ** utils.nextpow2(scale_time.shape[0]),
+        "nfft_scale": scale_time.shape[1],
+        "KIND": 2,
+    }
+    scale_rate, phase_scale_rate, _, _ = features.scaletime2scalerate(
+        scale_time, **strf_args
+    )
+    strf_ = strf_from_scalerate(
+        scale_rate,
+        phase_scale_rate,
+        (scale_time.shape[0], num_channels),
+        sr_time,
+        rates,
+        scales,
+    )
+    return strf_, scale_rate
+
+
+def scalerate_from_spectrogram(auditory_spectrogram_):
+    """
+    Scale and rate FFTs of strf(), which depend neither on the rate and
+    scale lists nor on sr_time.
+    """
+    strf_args = {
+        "num_channels": 128,
+        "num_ch_oct": 24,
+        "sr_time": 250,
+        "nfft_rate": 2 * 2 ** utils.nextpow2(auditory_spectrogram_.shape[0]),
+        "nfft_scale": 2 * 2 ** utils.nextpow2(auditory_spectrogram_.shape[1]),
+        "KIND": 2,
+    }
+    mod_scale, phase_scale, _, _ = features.spectrum2scaletime(
+        auditory_spectrogram_, **strf_args
+    )
+    scale_rate, phase_scale_rate, _, _ = features.scaletime2scalerate(
+        mod_scale * np.exp(1j * phase_scale), **strf_args
+    )
+    return scale_rate, phase_scale_rate
+
+
+def strf_from_scalerate(scale_rate, phase_scale_rate, shape, sr_time, rates, scales):
+    """
+    Cortical stage of strf() for the scale-rate representation of a
+    spectrogram of the given (time, channels) shape.
+    """
+    strf_args = {
+        "num_channels": shape[1],
+        "num_ch_oct": 24,
+        "sr_time": sr_time,
+        "nfft_rate": scale_rate.shape[0],
+        "nfft_scale": scale_rate.shape[1],
+        "KIND": 2,
+    }
+    # scalerate2cortical only reads the spectrogram shape
+    stft = np.broadcast_to(0.0, shape)
+    return features.scalerate2cortical(
+        stft, scale_rate, phase_scale_rate, scales, rates, **strf_args
+    )
+
+
+class SlidingSTRF:
+    """
+    Incremental STRF front-end for overlapping analysis windows.
+
+    Samples are pushed as they arrive; the cochlear filterbank, the per-frame
+    scale FFT and the per-frame sample peak are computed once per frame and
+    kept for as long as a window still needs them. Every completed window is
+    returned as its peak-normalized scale-time representation, ready for
+    strf_from_scaletime, so advancing by a hop only costs the new frames plus
+    the rate and cortical stages.
+    """
+
+    def __init__(
+        self,
+        window_duration=15,
+        hop_duration=5,
+        resampling_fs=16000,
+        num_threads=1,
+    ):
+        self.sr_time = load_static_params()["sr_time"]
+        wav2aud_params = load_wav2aud_params(self.sr_time, resampling_fs)
+        del wav2aud_params["filt"], wav2aud_params["VERB"]
+        self.stream = features.AuditorySpectrogramStream(
+            **wav2aud_params, num_threads=num_threads
+        )
+        self.L_frm = self.stream.L_frm
+        self.num_channels = self.stream.M - 1
+        self.nfft_scale = 2 * 2 ** utils.nextpow2(self.num_channels)
+        self.window_frames = int(window_duration * self.sr_time)
+        self.hop_frames = round(hop_duration * self.sr_time)
+        if self.hop_frames < 1:
+            raise ValueError(f"Hop of {hop_duration} s is shorter than one frame")
+
+        self.pending = np.zeros(0)
+        self.scale_time = np.zeros((0, self.nfft_scale), dtype=complex)
+        self.peaks = np.zeros(0)
+        # absolute frame index of scale_time[0] and of the next window start
+        self.offset = 0
+        self.next_start = 0
+
+    def push(self, samples):
+        """
+        Feed the next samples (at resampling_fs) and return the scale-time
+        representations of the windows completed by them.
+        """
+        x = np.r_[self.pending, np.asarray(samples, dtype=float).ravel()]
+        n = (len(x) // self.L_frm) * self.L_frm
+        self.pending = x[n:]
+        if n:
+            frames = self.stream.process(x[:n])
+            self.scale_time = np.r_[
+                self.scale_time, np.fft.fft(frames, self.nfft_scale, axis=1)
+            ]
+            self.peaks = np.r_[self.peaks, x[:n].reshape(-1, self.L_frm).max(axis=1)]
+
+        windows = []
+        while self.offset + len(self.peaks) >= self.next_start + self.window_frames:
+            begin = self.next_start - self.offset
+            end = begin + self.window_frames
+            scale = 1 / 1.01 / (np.max(self.peaks[begin:end]) + np.finfo(float).eps)
+            windows.append(self.scale_time[begin:end] * scale)
+
+            # drop the frames no later window needs
+            self.next_start += self.hop_frames
+            drop = min(self.next_start - self.offset, len(self.peaks))
+            self.scale_time = self.scale_time[drop:]
+            self.peaks = self.peaks[drop:]
+            self.offset += drop
+        return windows
+
+    def close(self):
+        self.stream.close()
 
 
 if __name__ == "__main__":
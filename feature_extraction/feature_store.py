@@ -0,0 +1,110 @@
+"""
+Store of per-segment STRF features.
+
+Entries hold the (128, 8, 22) features of one segment, keyed by a hash of
+the segment samples and of a fingerprint of the extraction parameters, so
+re-scoring, reprocessing and duplicate segments skip the STRF entirely. A
+small in-memory LRU sits in front of an on-disk directory of .npy files
+shared by all server workers; the least recently used files are evicted
+once the directory grows past its size bound. The LRU is shared by the
+request threads, so it is guarded by a lock.
+"""
+
+import functools
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+from feature_extraction import auditory, spectrogram_cache
+from globals import (
+    FEATURE_STORE_DIR,
+    FEATURE_STORE_FLOAT16,
+    FEATURE_STORE_MAX_MB,
+    FEATURE_STORE_MEMORY_ENTRIES,
+)
+
+
+def extraction_params(sample_rate, duration, rates, scales, dtype):
+    return {
+        "audio_fs": sample_rate,
+        "duration": duration,
+        "rates": list(rates),
+        "scales": list(scales),
+        "dtype": np.dtype(dtype).name,
+        **auditory.load_wav2aud_params(),
+    }
+
+
+class FeatureStore:
+    def __init__(self, store_dir: Path, max_bytes, memory_entries=256, dtype=np.float64):
+        self.store_dir = Path(store_dir)
+        self.store_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.memory_entries = memory_entries
+        self.dtype = np.dtype(dtype)
+        self.memory = OrderedDict()
+        self.memory_lock = threading.Lock()
+
+    def key(self, segment, params):
+        h = hashlib.sha256(np.ascontiguousarray(segment, dtype=float).tobytes())
+        h.update(spectrogram_cache.fingerprint(params).encode())
+        return h.hexdigest()
+
+    def get(self, key):
+        with self.memory_lock:
+            features = self.memory.get(key)
+            if features is not None:
+                self.memory.move_to_end(key)
+        if features is not None:
+            return features.astype(float)
+
+        path = self.store_dir / f"{key}.npy"
+        try:
+            features = np.load(path)
+            os.utime(path)
+        except (FileNotFoundError, ValueError, OSError):
+            # missing, evicted by another worker meanwhile, or corrupt
+            return None
+
+        self.remember(key, features)
+        return features.astype(float)
+
+    def put(self, key, features):
+        features = np.asarray(features, dtype=self.dtype)
+        self.remember(key, features)
+
+        fd, tmp = tempfile.mkstemp(dir=self.store_dir, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            np.save(f, features)
+        os.replace(tmp, self.store_dir / f"{key}.npy")
+        self.evict()
+
+    def remember(self, key, features):
+        with self.memory_lock:
+            self.memory[key] = features
+            self.memory.move_to_end(key)
+            while len(self.memory) > self.memory_entries:
+                self.memory.popitem(last=False)
+
+    def evict(self):
+        spectrogram_cache.evict_lru(self.store_dir, "*.npy", max_bytes=self.max_bytes)
+
+
+@functools.cache
+def default_store():
+    """
+    Store configured by FEATURE_STORE_DIR, or None when disabled.
+    """
+    if not FEATURE_STORE_DIR:
+        return None
+    return FeatureStore(
+        FEATURE_STORE_DIR,
+        FEATURE_STORE_MAX_MB * 2**20,
+        FEATURE_STORE_MEMORY_ENTRIES,
+        np.float16 if FEATURE_STORE_FLOAT16 else np.float64,
+    )
@@ -9,6 +9,7 @@ Implementation using a light implementation of the Matlab NLS toolbox by TODO
 
 import numpy as np
 import math
+from concurrent.futures import ThreadPoolExecutor
 from scipy import signal
 import matplotlib.pylab as plt
 from feature_extraction import utils
@@ -140,12 +141,37 @@ def scalerate2cortical(
 
 
 def waveform2auditoryspectrogram(
-    x_, frame_length, time_constant, compression_factor, octave_shift, filt, VERB
+    x_,
+    frame_length,
+    time_constant,
+    compression_factor,
+    octave_shift,
+    filt,
+    VERB,
+    num_threads=1,
 ):
     """
     Wav2Aud form NSL toolbox
     @url http://www.isr.umd.edu/Labs/NSL/Software.htm
+
+    With num_threads > 1 the channels are filtered in a thread pool through
+    AuditorySpectrogramStream, block by block to bound memory.
     """
+    if num_threads > 1 and time_constant:
+        stream = AuditorySpectrogramStream(
+            frame_length,
+            time_constant,
+            compression_factor,
+            octave_shift,
+            num_threads=num_threads,
+        )
+        try:
+            block_n = 256 * stream.L_frm
+            x = np.asarray(x_, dtype=float).ravel()
+            v5 = [stream.process(x[i: i + block_n]) for i in range(0, len(x), block_n)]
+            return np.concatenate(v5 + [stream.flush()])
+        finally:
+            stream.close()
 
     # if (filt == 'k'):
     #     raise ValueError('Please use wav2aud_fir function for FIR filtering!')
@@ -222,6 +248,121 @@ def waveform2auditoryspectrogram(
     return v5
 
 
+class AuditorySpectrogramStream:
+    """
+    Stateful Wav2Aud: consecutive blocks of one waveform are pushed through
+    the cochlear filterbank with the lfilter states carried across blocks,
+    so the result matches a single waveform2auditoryspectrogram pass.
+    Only leaky integration (time_constant > 0) is supported.
+
+    With num_threads > 1 the per-channel lfilter calls, which release the
+    GIL, run in a thread pool and the lateral inhibition, rectification and
+    leaky integration are applied to all channels at once afterwards.
+    """
+
+    def __init__(
+        self,
+        frame_length,
+        time_constant,
+        compression_factor,
+        octave_shift,
+        num_threads=1,
+    ):
+        if not time_constant:
+            raise ValueError("Streaming requires leaky integration (time_constant > 0).")
+
+        COCHBA = utils.COCHBA
+        self.M = COCHBA.shape[1]
+        shft = octave_shift
+        self.fac = compression_factor
+        self.L_frm = round(frame_length * 2 ** (4 + shft))
+        self.alph = math.exp(-1 / (time_constant * 2 ** (4 + shft)))
+        haircell_tc = 0.5
+        self.beta = math.exp(-1 / (haircell_tc * 2 ** (4 + shft)))
+
+        # filter coefficients and zero initial states for every channel
+        self.coeffs = []
+        self.zi_cochlea = []
+        for ch in range(self.M):
+            p = int(COCHBA[0, ch].real)
+            B = COCHBA[np.arange(p + 1) + 1, ch].real
+            A = COCHBA[np.arange(p + 1) + 1, ch].imag
+            self.coeffs.append((B, A))
+            self.zi_cochlea.append(np.zeros(max(len(A), len(B)) - 1))
+        self.zi_haircell = np.zeros((1, self.M))
+        self.zi_integration = np.zeros((1, self.M - 1))
+        self.pending = np.zeros(0)
+        self.executor = (
+            ThreadPoolExecutor(max_workers=num_threads) if num_threads > 1 else None
+        )
+
+    def process(self, x_):
+        """
+        Filter the next block of samples and return the completed frames,
+        shape (n_frames, M - 1). Samples not filling a whole frame are kept
+        for the next call.
+        """
+        x = np.r_[self.pending, np.asarray(x_, dtype=float).ravel()]
+        n = (len(x) // self.L_frm) * self.L_frm
+        self.pending = x[n:]
+        x = x[:n]
+        N = n // self.L_frm
+        v5 = np.zeros((N, self.M - 1))
+        if N == 0:
+            return v5
+
+        if self.executor is not None:
+            y2 = np.empty((n, self.M), order="F")
+
+            def haircell(ch):
+                y2[:, ch] = self._haircell(x, ch)
+
+            list(self.executor.map(haircell, range(self.M)))
+
+            # lateral inhibition between neighbouring channels ---> y4
+            y4 = np.maximum(y2[:, :-1] - y2[:, 1:], 0)
+            y5, self.zi_integration = signal.lfilter(
+                [1.0], [1.0, -self.alph], y4, axis=0, zi=self.zi_integration
+            )
+            return y5[self.L_frm * np.arange(1, N + 1) - 1]
+
+        y2_h = self._haircell(x, self.M - 1)
+        for ch in range((self.M - 2), -1, -1):
+            y2 = self._haircell(x, ch)
+            y4 = np.maximum(y2 - y2_h, 0)
+            y2_h = y2
+            y5, zf = signal.lfilter(
+                [1.0], [1.0, -self.alph], y4, zi=self.zi_integration[:, ch]
+            )
+            self.zi_integration[:, ch] = zf
+            v5[:, ch] = y5[self.L_frm * np.arange(1, N + 1) - 1]
+        return v5
+
+    def flush(self):
+        """
+        Zero-pad the remaining samples to a whole frame, as the batch
+        implementation does at the end of the waveform.
+        """
+        if len(self.pending) == 0:
+            return np.zeros((0, self.M - 1))
+        return self.process(np.zeros(self.L_frm - len(self.pending)))
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+
+    def _haircell(self, x, ch):
+        B, A = self.coeffs[ch]
+        y1, self.zi_cochlea[ch] = signal.lfilter(B, A, x, zi=self.zi_cochlea[ch])
+        y2 = utils.sigmoid(y1, self.fac)
+        if self.fac != -2:
+            y2, zf = signal.lfilter(
+                [1.0], [1.0, -self.beta], y2, zi=self.zi_haircell[:, ch]
+            )
+            self.zi_haircell[:, ch] = zf
+        return y2
+
+
 def complexSpectrogram(waveform, windowSize, frameStep):
     # % Figure out the fftSize (twice the window size because we are doing
     # % circular convolution).  We'll place the windowed time-domain signal into
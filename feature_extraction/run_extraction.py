@@ -5,16 +5,20 @@ All rights reserved
 
 """
 
+import multiprocessing
 import os
 import pickle
 import sys
-from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
 from pathlib import Path
+from signal import SIGTERM
 
 import numpy as np
+from scipy import signal
 
-from feature_extraction import auditory, utils
-from globals import MAX_WORKERS
+from feature_extraction import auditory, feature_store, utils
+from globals import COCHLEAR_THREADS, MAX_WORKERS
 from profiler import profile
 
 sys.path.append(str(Path(__file__).resolve().parent))
@@ -45,10 +49,30 @@ rates_vec = [
 ]
 scales_vec = [0.71, 1.0, 1.41, 2.00, 2.83, 4.00, 5.66, 8.00]
 
+# Band edges the modulation power spectrum is pooled over for screening
+screening_rate_edges = [0.25, 0.5, 1, 2, 4, 8, 16, 32]  # Hz, both directions
+screening_scale_edges = [0, 0.5, 1, 2, 4, 8]  # cyc/oct
 
-def extract_features(audio_segment, fs):
+
+def cochlear_threads(num_segments):
+    """
+    Number of threads for the cochlear filterbank of each segment, so that
+    a single segment can still use every core.
+    """
+    if COCHLEAR_THREADS > 0:
+        return COCHLEAR_THREADS
+    concurrent = max(1, min(int(MAX_WORKERS), num_segments))
+    return max(1, (os.cpu_count() or 1) // concurrent)
+
+
+def extract_features(audio_segment, fs, num_threads=1):
     strf, auditory_spectrogram_, mod_scale, scale_rate = auditory.strf(
-        audio_segment, audio_fs=fs, duration=15, rates=rates_vec, scales=scales_vec
+        audio_segment,
+        audio_fs=fs,
+        duration=15,
+        rates=rates_vec,
+        scales=scales_vec,
+        num_threads=num_threads,
     )
 
     # prints entire array
@@ -67,6 +91,31 @@ def extract_features(audio_segment, fs):
     return real_valued_strf, fs
 
 
+def extract_screening_features(audio_segment, fs):
+    """
+    Cheap features for the screening model: the auditory spectrum (128)
+    followed by the mean modulation power in each band of upward and
+    downward rates by scales (70), from a single spectrogram pass.
+    """
+    auditory_spectrogram_ = auditory.spectrogram(audio_segment, audio_fs=fs, duration=15)
+    spectrum_ = np.mean(auditory_spectrogram_, axis=0)
+    mps_ = auditory.mps_from_spectrogram(auditory_spectrogram_, 250)
+
+    # rows of the MPS are signed rates, columns signed scales
+    rate_hz = np.fft.fftfreq(mps_.shape[0], d=1 / 250)
+    scale_cyc = np.abs(np.fft.fftfreq(mps_.shape[1], d=1 / 24))
+
+    bands = []
+    for direction in (1, -1):
+        for r0, r1 in zip(screening_rate_edges[:-1], screening_rate_edges[1:]):
+            rows = (direction * rate_hz >= r0) & (direction * rate_hz < r1)
+            for s0, s1 in zip(screening_scale_edges[:-1], screening_scale_edges[1:]):
+                cols = (scale_cyc >= s0) & (scale_cyc < s1)
+                bands.append(np.mean(mps_[np.ix_(rows, cols)]))
+
+    return np.concatenate([spectrum_, bands])
+
+
 # feature extraction for segmented audio in specific directory
 def feature_extract_dir(input_dir: Path, output_dir: Path):
     for filename in input_dir.iterdir():
@@ -89,25 +138,250 @@ def feature_extract_dir(input_dir: Path, output_dir: Path):
         print(f"Saved output to: {output_file}")
 
 
-def process_segment(i, segment, sample_rate):
+def process_segment(i, segment, sample_rate, num_threads=1):
     print(f"Processing Segment {i + 1}")
 
-    real_valued_strf, fs = extract_features(segment, sample_rate)
+    real_valued_strf, fs = extract_features(segment, sample_rate, num_threads)
 
     return real_valued_strf
 
 
+def process_screening_segment(i, segment, sample_rate):
+    print(f"Screening Segment {i + 1}")
+
+    return extract_screening_features(segment, sample_rate)
+
+
 @profile
-def feature_extract_segments(segment_audio_arr, sample_rate):
+def feature_extract_screening(segment_audio_arr, sample_rate):
     with ProcessPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        # Submit in order and keep the futures in the same order
-
         futures = [
-            executor.submit(process_segment, i, segment, sample_rate)
+            executor.submit(process_screening_segment, i, segment, sample_rate)
             for i, segment in enumerate(segment_audio_arr)
         ]
 
-        # Retrieve results in the same order as submitted
         features = [future.result() for future in futures]
 
     return features
+
+
+def process_spectrogram(i, auditory_spectrogram_):
+    print(f"Processing Segment {i + 1}")
+
+    strf, _, _ = auditory.strf_from_spectrogram(
+        auditory_spectrogram_, 250, rates_vec, scales_vec
+    )
+
+    return np.mean(np.abs(strf), axis=0)
+
+
+@profile
+def feature_extract_recording(audio, sample_rate, segment_length=15):
+    """
+    Whole-recording variant of feature_extract_segments: the cochlear
+    filterbank runs once over the recording in the main process and each
+    segment's spectrogram block is handed to the pool for the modulation
+    stages as soon as it is complete.
+    """
+    with ProcessPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = [
+            executor.submit(process_spectrogram, i, auditory_spectrogram_)
+            for i, auditory_spectrogram_ in enumerate(
+                auditory.recording_spectrograms(
+                    audio,
+                    audio_fs=sample_rate,
+                    segment_duration=segment_length,
+                    num_threads=cochlear_threads(1),
+                )
+            )
+        ]
+
+        features = [future.result() for future in futures]
+
+    return features
+
+
+def process_scaletime(i, scale_time):
+    print(f"Processing Window {i + 1}")
+
+    strf, _ = auditory.strf_from_scaletime(scale_time, 128, 250, rates_vec, scales_vec)
+
+    return np.mean(np.abs(strf), axis=0)
+
+
+@profile
+def feature_extract_sliding(audio, sample_rate, segment_length=15, hop_length=5):
+    """
+    Features for overlapping windows of segment_length seconds every
+    hop_length seconds. auditory.SlidingSTRF reuses the spectrogram frames
+    and scale FFTs shared by overlapping windows, only the rate and cortical
+    stages run per window in the pool.
+    """
+    resampling_fs = 16000
+    if sample_rate != resampling_fs:
+        audio = signal.resample(
+            audio, int(len(audio) / sample_rate * resampling_fs)
+        )
+
+    sliding = auditory.SlidingSTRF(
+        segment_length, hop_length, resampling_fs, num_threads=cochlear_threads(1)
+    )
+    block_n = resampling_fs
+    with ProcessPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = []
+        try:
+            for start in range(0, len(audio), block_n):
+                for scale_time in sliding.push(audio[start: start + block_n]):
+                    futures.append(
+                        executor.submit(process_scaletime, len(futures), scale_time)
+                    )
+        finally:
+            sliding.close()
+
+        features = [future.result() for future in futures]
+
+    return features
+
+
+def segment_keys(segment_audio_arr, sample_rate):
+    """
+    Feature store and per-segment keys, equal for identical segments.
+    Without a store the keys are the segment indices.
+    """
+    store = feature_store.default_store()
+    if store is None:
+        return None, list(range(len(segment_audio_arr)))
+
+    params = feature_store.extraction_params(
+        sample_rate, 15, rates_vec, scales_vec, store.dtype
+    )
+    return store, [store.key(segment, params) for segment in segment_audio_arr]
+
+
+def stored_features(segment_audio_arr, sample_rate):
+    """
+    Store, per-segment keys and the features already in the feature store
+    (None for segments still to extract).
+    """
+    store, keys = segment_keys(segment_audio_arr, sample_rate)
+    if store is None:
+        return None, keys, [None] * len(segment_audio_arr)
+    return store, keys, [store.get(key) for key in keys]
+
+
+@profile
+def feature_extract_segments(segment_audio_arr, sample_rate):
+    store, keys, features = stored_features(segment_audio_arr, sample_rate)
+
+    with ProcessPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        # Submit in order, once per distinct segment not in the store
+
+        num_threads = cochlear_threads(sum(f is None for f in features))
+        futures = {}
+        for i, segment in enumerate(segment_audio_arr):
+            if features[i] is None and keys[i] not in futures:
+                futures[keys[i]] = executor.submit(
+                    process_segment, i, segment, sample_rate, num_threads
+                )
+
+        # Retrieve results in the same order as submitted
+        for i, key in enumerate(keys):
+            if features[i] is None:
+                features[i] = futures[key].result()
+
+    if store is not None:
+        for key, future in futures.items():
+            store.put(key, future.result())
+
+    return features
+
+
+def record_worker(pids):
+    pids.put(os.getpid())
+
+
+def worker_pool(workers):
+    """
+    Process pool and the queue its workers report their PIDs to when they
+    start, for terminate_workers.
+    """
+    pids = multiprocessing.SimpleQueue()
+    executor = ProcessPoolExecutor(
+        max_workers=workers, initializer=record_worker, initargs=(pids,)
+    )
+    return executor, pids
+
+
+def terminate_workers(pids):
+    """
+    Kill the workers of a worker_pool whose running tasks are no longer
+    needed; cancel_futures only drops the tasks not started yet. The pool
+    is broken afterwards.
+    """
+    while not pids.empty():
+        try:
+            os.kill(pids.get(), SIGTERM)
+        except ProcessLookupError:
+            pass
+
+
+@profile
+def feature_extract_sequential(segment_audio_arr, sample_rate, stop):
+    """
+    Sequential variant of feature_extract_segments: segments are scheduled
+    in order, no more than the pool can run at once, and stop(features) is
+    called each time the next segment in order completes. Each segment is
+    looked up in the feature store when it is scheduled, and duplicates of
+    a segment already scheduled share its extraction. Once stop returns
+    True the remaining segments are never scheduled and the workers still
+    extracting segments are terminated.
+    """
+    workers = int(MAX_WORKERS)
+    store, keys = segment_keys(segment_audio_arr, sample_rate)
+    num_threads = cochlear_threads(len(segment_audio_arr))
+
+    features = []
+    stopped = False
+    executor, pids = worker_pool(workers)
+    try:
+        # features, or the future extracting them, per key scheduled so far
+        extracted = {}
+        running = deque()
+        scheduled = 0
+        while scheduled < len(segment_audio_arr) or running:
+            while scheduled < len(segment_audio_arr) and len(running) < workers:
+                key = keys[scheduled]
+                if key not in extracted:
+                    extracted[key] = store.get(key) if store is not None else None
+                if extracted[key] is None:
+                    extracted[key] = executor.submit(
+                        process_segment,
+                        scheduled,
+                        segment_audio_arr[scheduled],
+                        sample_rate,
+                        num_threads,
+                    )
+                running.append((scheduled, extracted[key]))
+                scheduled += 1
+
+            i, result = running.popleft()
+            if isinstance(result, Future):
+                future, result = result, result.result()
+                # first segment of its key to complete
+                if extracted[keys[i]] is future:
+                    extracted[keys[i]] = result
+                    if store is not None:
+                        store.put(keys[i], result)
+            features.append(result)
+
+            if stop(features):
+                stopped = True
+                break
+    finally:
+        if stopped and any(
+            isinstance(f, Future) and not f.done() for _, f in running
+        ):
+            terminate_workers(pids)
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    return features
@@ -0,0 +1,108 @@
+"""
+Content-addressed on-disk cache of auditory spectrograms.
+
+Entries are compressed .npz files keyed by a hash of the input waveform and
+of a fingerprint of every parameter that affects the cochlear pass. Hits
+refresh the file mtime and the least recently used entries are evicted once
+the directory grows past its size bound, so the cache can be shared by
+several processes working on the same directory.
+"""
+
+import functools
+import hashlib
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from feature_extraction import utils
+from globals import SPECTROGRAM_CACHE_DIR, SPECTROGRAM_CACHE_MAX_MB
+
+
+def fingerprint(params):
+    """
+    Stable string describing the parameters (and the cochlear filter
+    coefficients) a spectrogram was computed with.
+    """
+    cochba = hashlib.sha1(np.ascontiguousarray(utils.COCHBA).tobytes()).hexdigest()
+    return json.dumps({**params, "COCHBA": cochba}, sort_keys=True)
+
+
+def evict_lru(directory: Path, pattern, max_bytes=None, max_entries=None, ttl=None):
+    """
+    Remove the files of directory matching pattern, least recently used
+    (oldest mtime) first, until at most max_entries of them totalling at
+    most max_bytes remain, as well as those idle for longer than ttl
+    seconds. Files removed by another process meanwhile are skipped.
+    """
+    entries = []
+    for path in Path(directory).glob(pattern):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+    now = time.time()
+    total = sum(size for _, size, _ in entries)
+    count = len(entries)
+    for mtime, size, path in sorted(entries):
+        if (
+            (max_bytes is None or total <= max_bytes)
+            and (max_entries is None or count <= max_entries)
+            and (ttl is None or now - mtime <= ttl)
+        ):
+            continue
+        path.unlink(missing_ok=True)
+        total -= size
+        count -= 1
+
+
+class SpectrogramCache:
+    def __init__(self, cache_dir: Path, max_bytes):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+
+    def key(self, wavtemp, params):
+        h = hashlib.sha256(np.ascontiguousarray(wavtemp, dtype=float).tobytes())
+        h.update(fingerprint(params).encode())
+        return h.hexdigest()
+
+    def get(self, key, params):
+        path = self.cache_dir / f"{key}.npz"
+        try:
+            with np.load(path) as entry:
+                if str(entry["fingerprint"]) != fingerprint(params):
+                    return None
+                auditory_spectrogram_ = entry["spectrogram"]
+            os.utime(path)
+        except (FileNotFoundError, KeyError, ValueError, OSError):
+            # missing, evicted by another process meanwhile, or corrupt
+            return None
+        return auditory_spectrogram_
+
+    def put(self, key, params, auditory_spectrogram_):
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            np.savez_compressed(
+                f, spectrogram=auditory_spectrogram_, fingerprint=fingerprint(params)
+            )
+        os.replace(tmp, self.cache_dir / f"{key}.npz")
+        self.evict()
+
+    def evict(self):
+        evict_lru(self.cache_dir, "*.npz", max_bytes=self.max_bytes)
+
+
+@functools.cache
+def default_cache():
+    """
+    Cache configured by SPECTROGRAM_CACHE_DIR, or None when disabled.
+    """
+    if not SPECTROGRAM_CACHE_DIR:
+        return None
+    return SpectrogramCache(SPECTROGRAM_CACHE_DIR, SPECTROGRAM_CACHE_MAX_MB * 2**20)
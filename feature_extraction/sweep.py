@@ -0,0 +1,164 @@
+"""
+STRF parameter sweep over a directory of segmented audio.
+
+The auditory spectrogram and its scale/rate FFTs do not depend on the rate
+and scale lists or on sr_time, so they are computed once per file and cached
+as .npy files, keyed by the file contents and the spectrogram parameters.
+Every (file, grid) pair then only runs the cortical stage, memory-mapping
+the cached intermediates, and all results end up in a single pickle.
+
+Usage:
+    python -m feature_extraction.sweep INPUT_DIR OUTPUT.pkl --grids grids.json
+
+grids.json holds a list of {"rates": [...], "scales": [...], "sr_time": 250}
+objects; missing keys fall back to the values used by run_extraction.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from feature_extraction import auditory, spectrogram_cache, utils
+from feature_extraction.run_extraction import rates_vec, scales_vec
+from globals import MAX_WORKERS, OUTDIR
+from profiler import profile
+
+
+def load_grids(grids_path):
+    if grids_path is None:
+        return [{"rates": rates_vec, "scales": scales_vec, "sr_time": 250}]
+
+    with open(grids_path) as f:
+        grids = json.load(f)
+
+    return [
+        {
+            "rates": grid.get("rates", rates_vec),
+            "scales": grid.get("scales", scales_vec),
+            "sr_time": grid.get("sr_time", 250),
+        }
+        for grid in grids
+    ]
+
+
+# Parameters of the spectrogram stage, the same for every grid
+INTERMEDIATE_PARAMS = {"duration": 15, **auditory.load_wav2aud_params()}
+
+
+def intermediate_path(prefix: Path, name):
+    return prefix.with_name(f"{prefix.name}_{name}.npy")
+
+
+def save_intermediate(prefix: Path, name, array):
+    # written aside and renamed, so readers never see a partial file
+    fd, tmp = tempfile.mkstemp(dir=prefix.parent, suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        np.save(f, array)
+    os.replace(tmp, intermediate_path(prefix, name))
+
+
+def cache_intermediates(audio_file: Path, cache_dir: Path):
+    """
+    Compute the rate/scale independent intermediates of one file, unless
+    they are already cached, and return their cache path prefix.
+    """
+    h = hashlib.sha1(audio_file.read_bytes())
+    h.update(spectrogram_cache.fingerprint(INTERMEDIATE_PARAMS).encode())
+    prefix = cache_dir / h.hexdigest()
+    if intermediate_path(prefix, "phase").exists():
+        return prefix
+
+    print(f"Computing intermediates: {audio_file.name}")
+    audio, fs = utils.audio_data(audio_file)
+    auditory_spectrogram_ = auditory.spectrogram(
+        audio, audio_fs=fs, duration=INTERMEDIATE_PARAMS["duration"]
+    )
+    scale_rate, phase_scale_rate = auditory.scalerate_from_spectrogram(
+        auditory_spectrogram_
+    )
+
+    save_intermediate(prefix, "shape", np.array(auditory_spectrogram_.shape))
+    save_intermediate(prefix, "scale_rate", scale_rate)
+    # written last, marks the entry as complete
+    save_intermediate(prefix, "phase", phase_scale_rate)
+    return prefix
+
+
+def evaluate_grid(prefix: Path, grid):
+    shape = tuple(np.load(intermediate_path(prefix, "shape")))
+    scale_rate = np.load(intermediate_path(prefix, "scale_rate"), mmap_mode="r")
+    phase_scale_rate = np.load(intermediate_path(prefix, "phase"), mmap_mode="r")
+
+    strf = auditory.strf_from_scalerate(
+        scale_rate,
+        phase_scale_rate,
+        shape,
+        grid["sr_time"],
+        grid["rates"],
+        grid["scales"],
+    )
+    return np.mean(np.abs(strf), axis=0)
+
+
+@profile
+def sweep(input_dir: Path, output_file: Path, grids, cache_dir: Path, workers):
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    audio_files = sorted(input_dir.glob("*.wav"))
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        prefixes = list(
+            executor.map(
+                cache_intermediates, audio_files, [cache_dir] * len(audio_files)
+            )
+        )
+
+        futures = {
+            (audio_file.name, g): executor.submit(evaluate_grid, prefix, grid)
+            for audio_file, prefix in zip(audio_files, prefixes)
+            for g, grid in enumerate(grids)
+        }
+
+        results = {audio_file.name: [None] * len(grids) for audio_file in audio_files}
+        for (name, g), future in futures.items():
+            results[name][g] = future.result()
+
+    sweep_data = {
+        "grids": grids,
+        "files": [audio_file.name for audio_file in audio_files],
+        "strf": results,
+    }
+    with open(output_file, "wb") as f:
+        pickle.dump(sweep_data, f)
+
+    print(f"Saved {len(audio_files)} files x {len(grids)} grids to: {output_file}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n\n")[0])
+    parser.add_argument("input_dir", type=Path)
+    parser.add_argument("output_file", type=Path)
+    parser.add_argument("--grids", type=Path, help="JSON list of rate/scale grids")
+    parser.add_argument(
+        "--cache-dir", type=Path, default=Path(OUTDIR / "feature_analysis/sweep_cache")
+    )
+    parser.add_argument("--workers", type=int, default=int(MAX_WORKERS))
+    args = parser.parse_args()
+
+    sweep(
+        args.input_dir,
+        args.output_file,
+        load_grids(args.grids),
+        args.cache_dir,
+        args.workers,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -5,3 +5,73 @@ from pathlib import Path
 MAX_WORKERS = os.getenv("MAX_WORKERS") or 2
 OUTDIR = Path(os.getenv("OUTDIR") or "/tmp/sleepspec")
 OUTDIR.mkdir(exist_ok=True)
+
+# Served SVM/PCA model, checked for changes every MODEL_RELOAD_INTERVAL
+# seconds (0 disables hot reload)
+MODEL_PATH = Path(
+    os.getenv("MODEL_PATH") or "./updated_model/svm_pca_strf_ncomp24_2025-05-29.pkl"
+)
+MODEL_RELOAD_INTERVAL = float(os.getenv("MODEL_RELOAD_INTERVAL") or 5)
+
+# JSON config of several models scored on the same features (primary with
+# optional A/B weights, plus shadows), replaces MODEL_PATH when set; shadow
+# results are appended to SHADOW_LOG
+MODELS_CONFIG = os.getenv("MODELS_CONFIG")
+SHADOW_LOG = Path(os.getenv("SHADOW_LOG") or OUTDIR / "shadow_scores.jsonl")
+
+# Segment rows of concurrent requests are scored together, collected for up
+# to MICROBATCH_WINDOW_MS milliseconds or MICROBATCH_MAX_ROWS rows (0 disables)
+MICROBATCH_WINDOW_MS = float(os.getenv("MICROBATCH_WINDOW_MS") or 0)
+MICROBATCH_MAX_ROWS = int(os.getenv("MICROBATCH_MAX_ROWS") or 64)
+
+# "segment": cochlear filterbank per 15 s segment (default)
+# "recording": one streaming filterbank pass over the whole recording
+# "sliding": overlapping 15 s windows every SEGMENT_HOP seconds
+SPECTROGRAM_MODE = os.getenv("SPECTROGRAM_MODE") or "segment"
+SEGMENT_HOP = float(os.getenv("SEGMENT_HOP") or 5)
+if SEGMENT_HOP <= 0:
+    raise ValueError(f"SEGMENT_HOP must be positive, got {SEGMENT_HOP}")
+
+# Sequential decision in "segment" mode: stop extracting once, after at least
+# EARLY_EXIT_MIN_SEGMENTS segments, the adjusted confidence score puts the
+# majority class probability at EARLY_EXIT_CONFIDENCE or above
+EARLY_EXIT = (os.getenv("EARLY_EXIT") or "false").lower() == "true"
+EARLY_EXIT_CONFIDENCE = float(os.getenv("EARLY_EXIT_CONFIDENCE") or 0.9)
+EARLY_EXIT_MIN_SEGMENTS = int(os.getenv("EARLY_EXIT_MIN_SEGMENTS") or 3)
+
+# Recordings longer than NOISE_REDUCTION_CHUNK seconds are Wiener filtered
+# in chunks of that length across the MAX_WORKERS process pool (0 disables)
+NOISE_REDUCTION_CHUNK = float(os.getenv("NOISE_REDUCTION_CHUNK") or 60)
+
+# Threads filtering the cochlear channels of one spectrogram, 0 spreads the
+# CPU cores over the segments being extracted concurrently
+COCHLEAR_THREADS = int(os.getenv("COCHLEAR_THREADS") or 1)
+
+# On-disk cache of auditory spectrograms for offline feature work, disabled
+# unless a directory is given
+SPECTROGRAM_CACHE_DIR = os.getenv("SPECTROGRAM_CACHE_DIR")
+SPECTROGRAM_CACHE_MAX_MB = int(os.getenv("SPECTROGRAM_CACHE_MAX_MB") or 1024)
+
+# Store of per-segment STRF features shared by all workers, disabled unless
+# a directory is given; FEATURE_STORE_FLOAT16 quarters the entry size
+FEATURE_STORE_DIR = os.getenv("FEATURE_STORE_DIR")
+FEATURE_STORE_MAX_MB = int(os.getenv("FEATURE_STORE_MAX_MB") or 1024)
+FEATURE_STORE_MEMORY_ENTRIES = int(os.getenv("FEATURE_STORE_MEMORY_ENTRIES") or 256)
+FEATURE_STORE_FLOAT16 = (os.getenv("FEATURE_STORE_FLOAT16") or "false").lower() == "true"
+
+# Two-stage classification in "segment" mode: a screening model on cheap
+# spectrum/MPS features answers when its average SD probability is outside
+# SCREENING_BAND ("low,high"), the full STRF pipeline runs otherwise
+SCREENING_MODEL = os.getenv("SCREENING_MODEL")
+SCREENING_BAND = tuple(
+    float(bound) for bound in (os.getenv("SCREENING_BAND") or "0.1,0.9").split(",")
+)
+
+# Nearest-neighbour index of classified recordings over their PCA
+# projections, queried by /similar/<uid>
+SIMILARITY_INDEX = (os.getenv("SIMILARITY_INDEX") or "false").lower() == "true"
+
+# Classification results of already seen audio, reused for retried uploads;
+# RESULT_CACHE_MAX_ENTRIES=0 disables the cache
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES") or 1024)
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL") or 24 * 3600)
@@ -0,0 +1,385 @@
+import queue
+import threading
+import time
+from dataclasses import dataclass
+
+import numpy as np
+
+# libsvm clamps pairwise probabilities to [MIN_PROB, 1 - MIN_PROB]
+MIN_PROB = 1e-7
+
+
+def normalize_features(features):
+    """
+    Stack per-segment features into one matrix, each row flattened and
+    scaled by its maximum absolute value.
+    """
+    feature_matrix = np.stack([np.asarray(feature).ravel() for feature in features])
+    peaks = np.max(np.abs(feature_matrix), axis=1, keepdims=True)
+    return np.divide(
+        feature_matrix, peaks, out=feature_matrix.astype(float), where=peaks != 0
+    )
+
+
+def adjusted_confidence(sd_counter, nsd_counter, avg_sd_prob, avg_nsd_prob):
+    """
+    Recording score from the segment counts and average probabilities of
+    each class: above 50 is sleep-deprived, below non-sleep-deprived.
+    """
+    if sd_counter == nsd_counter:
+        return 50 + (avg_sd_prob - avg_nsd_prob) * 50
+    elif sd_counter > nsd_counter:
+        return 50 + (avg_sd_prob * 50)
+    else:
+        return avg_nsd_prob * 50
+
+
+def platt_probabilities(decision, prob_a, prob_b):
+    """
+    Binary libsvm probabilities from sklearn decision values, columns in
+    classes_ order. libsvm's own decision value is the negated one and its
+    sigmoid gives the pairwise probability of classes_[0].
+    """
+    fApB = -decision * prob_a + prob_b
+    # numerically stable 1 / (1 + exp(fApB)), as libsvm's sigmoid_predict
+    r = np.where(
+        fApB >= 0,
+        np.exp(-np.abs(fApB)) / (1 + np.exp(-np.abs(fApB))),
+        1 / (1 + np.exp(-np.abs(fApB))),
+    )
+    r = np.clip(r, MIN_PROB, 1 - MIN_PROB)
+    return multiclass_probability_2(r)
+
+
+def multiclass_probability_2(r, max_iter=100):
+    """
+    libsvm's multiclass_probability for two classes, vectorized over rows.
+    sklearn's libsvm runs this fixed-point iteration even for binary models
+    and stops it at a tolerance, so the probabilities differ from the
+    pairwise estimate r by up to a few 1e-3; it is replayed here to
+    reproduce predict_proba.
+    """
+    k = 2
+    eps = 0.005 / k
+    s = 1 - r
+    Q = np.array([[s * s, -s * r], [-s * r, r * r]])
+    p = np.full((k, len(r)), 1.0 / k)
+    active = np.ones(len(r), dtype=bool)
+
+    for _ in range(max_iter):
+        Qp = np.einsum("tjn,jn->tn", Q, p)
+        pQp = np.sum(p * Qp, axis=0)
+        active &= np.max(np.abs(Qp - pQp), axis=0) >= eps
+        if not active.any():
+            break
+
+        for t in range(k):
+            diff = np.where(active, (-Qp[t] + pQp) / Q[t, t], 0.0)
+            p[t] += diff
+            pQp = (pQp + diff * (diff * Q[t, t] + 2 * Qp[t])) / (1 + diff) / (1 + diff)
+            Qp = (Qp + diff * Q[t]) / (1 + diff)
+            p /= 1 + diff
+
+    return p.T
+
+
+@dataclass(frozen=True)
+class FoldedLinearModel:
+    """
+    PCA followed by a binary linear SVC, folded into one weight vector:
+    decision = x @ weights + bias.
+    """
+
+    weights: np.ndarray
+    bias: float
+    classes: np.ndarray
+    prob_a: float | None
+    prob_b: float | None
+
+    @property
+    def n_features(self):
+        return self.weights.shape[0]
+
+    def decision_function(self, X):
+        return X @ self.weights + self.bias
+
+    def score(self, X):
+        decision = self.decision_function(X)
+        # libsvm picks classes_[1] for decision values >= 0
+        y_pred = self.classes[(decision >= 0).astype(int)]
+        probs = None
+        if self.prob_a is not None:
+            probs = platt_probabilities(decision, self.prob_a, self.prob_b)
+        return self.classes, y_pred, decision, probs
+
+
+@dataclass(frozen=True)
+class CompiledKernelSVC:
+    """
+    PCA followed by a binary kernel SVC, held as contiguous arrays. The
+    kernel rows of a whole batch against the support vectors come from one
+    matrix product: decision = K((x - mean) @ P, SV) @ dual_coef + intercept.
+    """
+
+    mean: np.ndarray
+    projection: np.ndarray
+    support_vectors: np.ndarray
+    dual_coef: np.ndarray
+    intercept: float
+    kernel: str
+    gamma: float
+    coef0: float
+    degree: int
+    classes: np.ndarray
+    prob_a: float | None
+    prob_b: float | None
+
+    @property
+    def n_features(self):
+        return self.projection.shape[0]
+
+    def kernel_rows(self, Z):
+        dot = Z @ self.support_vectors.T
+        if self.kernel == "rbf":
+            sq_dist = (
+                np.sum(Z * Z, axis=1)[:, None]
+                + np.sum(self.support_vectors**2, axis=1)[None, :]
+                - 2 * dot
+            )
+            return np.exp(-self.gamma * np.maximum(sq_dist, 0))
+        if self.kernel == "poly":
+            return (self.gamma * dot + self.coef0) ** self.degree
+        return np.tanh(self.gamma * dot + self.coef0)  # sigmoid
+
+    def decision_function(self, X):
+        Z = (X - self.mean) @ self.projection
+        return self.kernel_rows(Z) @ self.dual_coef + self.intercept
+
+    def score(self, X):
+        decision = self.decision_function(X)
+        # libsvm picks classes_[1] for decision values >= 0
+        y_pred = self.classes[(decision >= 0).astype(int)]
+        probs = None
+        if self.prob_a is not None:
+            probs = platt_probabilities(decision, self.prob_a, self.prob_b)
+        return self.classes, y_pred, decision, probs
+
+
+def pca_projection(pca):
+    """
+    (mean, projection matrix) such that pca.transform(X) == (X - mean) @ P.
+    """
+    projection = pca.components_.T
+    if pca.whiten:
+        projection = projection / np.sqrt(pca.explained_variance_)
+    return pca.mean_, projection
+
+
+def projection_of(pca, compiled=None):
+    """
+    (mean, projection matrix) of a model's PCA, or None when it has none or
+    it was folded into a linear model.
+    """
+    if pca is not None:
+        return pca_projection(pca)
+    if isinstance(compiled, CompiledKernelSVC):
+        return compiled.mean, compiled.projection
+    return None
+
+
+def fold_linear(mean, projection, coef, intercept):
+    """
+    Weights and bias of the linear decision function composed with the PCA
+    projection.
+    """
+    weights = projection @ coef
+    return np.ascontiguousarray(weights), float(intercept - mean @ weights)
+
+
+def platt_parameters(svm):
+    if not getattr(svm, "probability", False) or len(svm.probA_) != 1:
+        return None, None
+    return float(svm.probA_[0]), float(svm.probB_[0])
+
+
+def compile_model(svm, pca):
+    """
+    Compiled representation of a binary PCA + SVC model, or None when it
+    has no fast path and sklearn has to be used.
+    """
+    kernel = getattr(svm, "kernel", None)
+    if len(svm.classes_) != 2 or kernel not in ("linear", "rbf", "poly", "sigmoid"):
+        return None
+
+    mean, projection = pca_projection(pca)
+    prob_a, prob_b = platt_parameters(svm)
+
+    if kernel == "linear":
+        weights, bias = fold_linear(mean, projection, svm.coef_[0], svm.intercept_[0])
+        return FoldedLinearModel(
+            weights=weights,
+            bias=bias,
+            classes=np.asarray(svm.classes_),
+            prob_a=prob_a,
+            prob_b=prob_b,
+        )
+
+    return CompiledKernelSVC(
+        mean=np.ascontiguousarray(mean),
+        projection=np.ascontiguousarray(projection),
+        support_vectors=np.ascontiguousarray(svm.support_vectors_),
+        dual_coef=np.ascontiguousarray(svm.dual_coef_[0]),
+        intercept=float(svm.intercept_[0]),
+        kernel=kernel,
+        gamma=float(svm._gamma),
+        coef0=float(svm.coef0),
+        degree=int(svm.degree),
+        classes=np.asarray(svm.classes_),
+        prob_a=prob_a,
+        prob_b=prob_b,
+    )
+
+
+def score_features(feature_norm, svm, pca, compiled=None):
+    """
+    Classes, predicted labels, decision values and class probabilities (None
+    without Platt scaling) for normalized feature rows, through the compiled
+    model when there is one and sklearn otherwise.
+    """
+    if compiled is not None:
+        return compiled.score(feature_norm)
+
+    # models trained on raw features come without a PCA
+    feature_pca = pca.transform(feature_norm) if pca is not None else feature_norm
+    y_pred = svm.predict(feature_pca)
+    decision = svm.decision_function(feature_pca)
+    probs = svm.predict_proba(feature_pca) if hasattr(svm, "predict_proba") else None
+    return svm.classes_, y_pred, decision, probs
+
+
+def expected_features(svm, pca, compiled=None):
+    if compiled is not None:
+        return compiled.n_features
+    if pca is None:
+        return svm.n_features_in_
+    return pca.components_.shape[1]
+
+
+class MicroBatcher:
+    """
+    Scores feature rows submitted by concurrent requests in batches. The
+    first pending submission opens a window of window seconds, or until
+    max_rows rows are queued, and everything queued by then goes through a
+    single score(X) call, e.g. the compiled model's score, whose results
+    are split back per request.
+
+    The collecting thread starts on first use, so a batcher created before
+    gunicorn forks its workers still works in each of them. close() stops
+    it once everything queued is scored; later submissions are scored
+    directly.
+    """
+
+    def __init__(self, score, window=0.005, max_rows=64):
+        self.score = score
+        self.window = window
+        self.max_rows = max_rows
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+
+    def submit(self, X):
+        """
+        (classes, y_pred, decision, probs) of the rows of X, as score(X).
+        """
+        with self._lock:
+            if self._closed:
+                return self.score(X)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+            # queued under the lock, so always ahead of the close() sentinel
+            pending = {"X": X, "done": threading.Event()}
+            self._queue.put(pending)
+        pending["done"].wait()
+        if "error" in pending:
+            raise pending["error"]
+        return pending["result"]
+
+    def close(self):
+        """
+        Stop the collecting thread once the submissions queued so far are
+        scored.
+        """
+        with self._lock:
+            self._closed = True
+            if self._thread is not None:
+                self._queue.put(None)
+
+    def _collect(self):
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        rows = len(batch[0]["X"])
+        deadline = time.monotonic() + self.window
+        while rows < self.max_rows:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                pending = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if pending is None:
+                # closed, stop after this batch
+                self._queue.put(None)
+                break
+            batch.append(pending)
+            rows += len(pending["X"])
+        return batch
+
+    def _drain(self):
+        batch = []
+        while True:
+            try:
+                pending = self._queue.get_nowait()
+            except queue.Empty:
+                return batch
+            if pending is not None:
+                batch.append(pending)
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                # closed, score whatever is still queued and stop
+                batch = self._drain()
+                if batch:
+                    self._score(batch)
+                return
+            self._score(batch)
+
+    def _score(self, batch):
+        try:
+            classes, y_pred, decision, probs = self.score(
+                np.concatenate([pending["X"] for pending in batch])
+            )
+        except Exception as e:
+            for pending in batch:
+                pending["error"] = e
+                pending["done"].set()
+            return
+
+        start = 0
+        for pending in batch:
+            end = start + len(pending["X"])
+            pending["result"] = (
+                classes,
+                y_pred[start:end],
+                decision[start:end],
+                probs[start:end] if probs is not None else None,
+            )
+            pending["done"].set()
+            start = end
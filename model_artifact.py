@@ -0,0 +1,213 @@
+"""
+Pickle-free model artifacts.
+
+An artifact is a small JSON manifest plus an uncompressed .npz holding the
+PCA mean/components, the SVM support vectors, dual and linear coefficients,
+intercept and Platt parameters. Loading never unpickles anything: array
+headers are parsed and every array is memory-mapped straight out of the
+.npz, so all workers on a host share one page-cache copy.
+
+The .npz name carries its content hash and the manifest is replaced last,
+so a model registry watching the manifest never sees a half-written
+artifact and older mappings stay valid.
+
+Usage:
+    python model_artifact.py export MODEL.pkl ARTIFACT.json
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import struct
+import tempfile
+import zipfile
+from pathlib import Path
+
+import numpy as np
+
+from inference import CompiledKernelSVC, FoldedLinearModel, fold_linear, platt_parameters
+
+FORMAT = "sleepspec-svm-pca/1"
+
+
+def unwrap(data):
+    """
+    (svm, pca) of a pickled model: a {"svm", "pca"} dict, or a bare estimator
+    or fitted search such as population_level_svm.pkl, which have no PCA.
+    """
+    if isinstance(data, dict):
+        return data["svm"], data["pca"]
+    return getattr(data, "best_estimator_", data), None
+
+
+class IdentityPCA:
+    """
+    Stand-in PCA of a model scoring its input features directly.
+    """
+
+    def __init__(self, n_features):
+        self.mean_ = np.zeros(n_features)
+        self.components_ = np.eye(n_features)
+        self.explained_variance_ = np.ones(n_features)
+        self.whiten = False
+
+
+def export_artifact(svm, pca, manifest_path: Path):
+    kernel = svm.kernel
+    if len(svm.classes_) != 2 or kernel not in ("linear", "rbf", "poly", "sigmoid"):
+        raise ValueError(f"Unsupported model: {len(svm.classes_)} classes, {kernel}")
+    if pca is None:
+        # the artifact format always projects, with the identity here
+        pca = IdentityPCA(svm.n_features_in_)
+
+    arrays = {
+        "pca_mean": pca.mean_,
+        "pca_components": pca.components_,
+        "pca_explained_variance": pca.explained_variance_,
+        "intercept": svm.intercept_,
+    }
+    if kernel == "linear":
+        arrays["coef"] = svm.coef_
+    else:
+        arrays["support_vectors"] = svm.support_vectors_
+        arrays["dual_coef"] = svm.dual_coef_
+    prob_a, prob_b = platt_parameters(svm)
+    if prob_a is not None:
+        arrays["prob_a"] = svm.probA_
+        arrays["prob_b"] = svm.probB_
+
+    manifest_path = Path(manifest_path)
+    fd, tmp = tempfile.mkstemp(dir=manifest_path.parent, suffix=".npz")
+    with os.fdopen(fd, "wb") as f:
+        np.savez(f, **{name: np.asarray(a, dtype=float) for name, a in arrays.items()})
+    os.chmod(tmp, 0o644)
+    digest = hashlib.sha256(Path(tmp).read_bytes()).hexdigest()
+    arrays_path = manifest_path.with_name(f"{manifest_path.stem}-{digest[:12]}.npz")
+    os.replace(tmp, arrays_path)
+
+    manifest = {
+        "format": FORMAT,
+        "arrays": arrays_path.name,
+        "sha256": digest,
+        "kernel": kernel,
+        "gamma": float(svm._gamma),
+        "coef0": float(svm.coef0),
+        "degree": int(svm.degree),
+        "classes": [str(c) for c in svm.classes_],
+        "whiten": bool(pca.whiten),
+        "n_features": int(pca.components_.shape[1]),
+        "n_components": int(pca.components_.shape[0]),
+    }
+    fd, tmp = tempfile.mkstemp(dir=manifest_path.parent, suffix=".json")
+    with os.fdopen(fd, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.chmod(tmp, 0o644)
+    os.replace(tmp, manifest_path)
+
+    return manifest
+
+
+def memmap_npz(path: Path):
+    """
+    Memory-map every array of an uncompressed .npz without unpickling.
+    """
+    arrays = {}
+    with zipfile.ZipFile(path) as zf, open(path, "rb") as f:
+        for info in zf.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(f"{path}: {info.filename} is compressed")
+
+            # skip the local file header to the .npy payload
+            f.seek(info.header_offset)
+            header = f.read(30)
+            name_len, extra_len = struct.unpack("<HH", header[26:30])
+            f.seek(info.header_offset + 30 + name_len + extra_len)
+
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            if dtype.hasobject:
+                raise ValueError(f"{path}: {info.filename} holds Python objects")
+
+            arrays[info.filename.removesuffix(".npy")] = np.memmap(
+                path,
+                dtype=dtype,
+                mode="r",
+                offset=f.tell(),
+                shape=shape,
+                order="F" if fortran_order else "C",
+            )
+    return arrays
+
+
+def load_artifact(manifest_path: Path):
+    """
+    Compiled model (see inference.compile_model) and manifest of an artifact.
+    """
+    manifest_path = Path(manifest_path)
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    if manifest.get("format") != FORMAT:
+        raise ValueError(f"{manifest_path}: unknown format {manifest.get('format')}")
+
+    arrays = memmap_npz(manifest_path.with_name(manifest["arrays"]))
+
+    mean = arrays["pca_mean"]
+    projection = arrays["pca_components"].T
+    if manifest["whiten"]:
+        projection = projection / np.sqrt(arrays["pca_explained_variance"])
+
+    classes = np.asarray(manifest["classes"])
+    prob_a = float(arrays["prob_a"][0]) if "prob_a" in arrays else None
+    prob_b = float(arrays["prob_b"][0]) if "prob_b" in arrays else None
+    intercept = float(arrays["intercept"][0])
+
+    if manifest["kernel"] == "linear":
+        weights, bias = fold_linear(mean, projection, arrays["coef"][0], intercept)
+        compiled = FoldedLinearModel(
+            weights=weights,
+            bias=bias,
+            classes=classes,
+            prob_a=prob_a,
+            prob_b=prob_b,
+        )
+    else:
+        compiled = CompiledKernelSVC(
+            mean=mean,
+            projection=projection,
+            support_vectors=arrays["support_vectors"],
+            dual_coef=arrays["dual_coef"][0],
+            intercept=intercept,
+            kernel=manifest["kernel"],
+            gamma=manifest["gamma"],
+            coef0=manifest["coef0"],
+            degree=manifest["degree"],
+            classes=classes,
+            prob_a=prob_a,
+            prob_b=prob_b,
+        )
+    return compiled, manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pickle-free model artifacts.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export = subparsers.add_parser(
+        "export", help="convert a {svm, pca} pickle or a bare SVC/GridSearchCV"
+    )
+    export.add_argument("model", type=Path)
+    export.add_argument("manifest", type=Path)
+    args = parser.parse_args()
+
+    with open(args.model, "rb") as f:
+        data = pickle.load(f)
+    manifest = export_artifact(*unwrap(data), args.manifest)
+    print(f"Exported {args.model} to {args.manifest} ({manifest['arrays']})")
+
+
+if __name__ == "__main__":
+    main()
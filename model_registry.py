@@ -0,0 +1,180 @@
+import hashlib
+import json
+import pickle
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+from inference import compile_model
+from model_artifact import load_artifact, unwrap
+
+
+@dataclass(frozen=True)
+class LoadedModel:
+    svm: object
+    pca: object
+    path: Path
+    version: str  # content hash of the model file
+    compiled: object = None  # fast path from inference.compile_model, if any
+
+
+def load_model(path: Path) -> LoadedModel:
+    if path.suffix == ".json":
+        # pickle-free artifact, only the compiled model is available
+        compiled, manifest = load_artifact(path)
+        return LoadedModel(
+            svm=None,
+            pca=None,
+            path=path,
+            version=manifest["sha256"][:12],
+            compiled=compiled,
+        )
+
+    raw = path.read_bytes()
+    data = pickle.loads(raw)
+
+    svm, pca = unwrap(data)
+
+    return LoadedModel(
+        svm=svm,
+        pca=pca,
+        path=path,
+        version=hashlib.sha256(raw).hexdigest()[:12],
+        compiled=compile_model(svm, pca) if pca is not None else None,
+    )
+
+
+class ModelRegistry:
+    """
+    Keeps the SVM/PCA model deserialized for the lifetime of the process.
+    The path is either a {"svm", "pca"} pickle or the manifest of a
+    model_artifact export.
+
+    active() returns the current model; at most every reload_interval
+    seconds it also checks the file's mtime and size, and when the content
+    hash changed it loads the new file and swaps it in with a single
+    reference assignment. Requests keep the LoadedModel they started with,
+    so a reload never affects one in flight. The check runs on access
+    rather than in a background thread so it also works in forked gunicorn
+    workers.
+    """
+
+    def __init__(self, path: Path, reload_interval=5.0):
+        self.path = path
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._model = None
+        self._stat = None
+        self._checked_at = 0.0
+
+        try:
+            self.reload()
+        except FileNotFoundError:
+            print(f"Warning: model {self.path} not found, will retry on request.")
+
+    def active(self) -> LoadedModel:
+        if self._model is None:
+            self.reload()
+        elif (
+            self.reload_interval
+            and time.monotonic() - self._checked_at >= self.reload_interval
+        ):
+            self._check()
+        return self._model
+
+    def reload(self):
+        with self._lock:
+            stat = self.path.stat()
+            model = load_model(self.path)
+            if self._model is None or model.version != self._model.version:
+                print(f"Loaded model {model.path} (version {model.version})")
+                self._model = model
+            self._stat = (stat.st_mtime_ns, stat.st_size)
+            self._checked_at = time.monotonic()
+
+    def _check(self):
+        self._checked_at = time.monotonic()
+        try:
+            stat = self.path.stat()
+            if (stat.st_mtime_ns, stat.st_size) != self._stat:
+                self.reload()
+        except Exception as e:
+            # e.g. the file is being replaced, keep serving the current model
+            print(f"Model reload failed, keeping version {self._model.version}: {e}")
+
+
+class ModelRouter:
+    """
+    Several named models served side by side, so one set of extracted
+    features can be scored against all of them. route() picks the primary
+    model of a request, whose result is returned, and the shadow models,
+    whose results are only logged.
+
+    The config is a JSON object:
+
+        {
+            "models": {"ncomp24": "updated_model/...pkl", "strf": "...", "retrained": "..."},
+            "primary": {"ncomp24": 0.9, "strf": 0.1},
+            "shadow": ["retrained"]
+        }
+
+    "primary" is either a model name or A/B weights; the arm is chosen from
+    a hash of the request key, so retries of one upload stay on the same
+    model. The arms not chosen are scored as shadows too. Every model scores
+    the same STRF feature vector, so all of them must take its 22528 values.
+    """
+
+    def __init__(self, models: dict, primary, shadow=(), reload_interval=5.0):
+        self.registries = {
+            name: ModelRegistry(Path(path), reload_interval)
+            for name, path in models.items()
+        }
+        self.weights = {primary: 1.0} if isinstance(primary, str) else dict(primary)
+        self.shadow = list(shadow)
+
+        for name in [*self.weights, *self.shadow]:
+            if name not in self.registries:
+                raise ValueError(f"Model {name} is routed but not registered")
+        if not self.weights or sum(self.weights.values()) <= 0:
+            raise ValueError("No primary model weights")
+
+    @classmethod
+    def from_config(cls, config_path: Path, reload_interval=5.0):
+        with open(config_path) as f:
+            config = json.load(f)
+        return cls(
+            config["models"],
+            config["primary"],
+            config.get("shadow", []),
+            reload_interval,
+        )
+
+    def route(self, key: str):
+        """
+        (primary model name, shadow model names) for a request key.
+        """
+        digest = hashlib.sha256(key.encode()).digest()
+        point = int.from_bytes(digest[:8], "big") / 2**64 * sum(self.weights.values())
+
+        primary = None
+        for name, weight in self.weights.items():
+            primary = name
+            point -= weight
+            if point < 0:
+                break
+
+        shadows = [name for name in [*self.weights, *self.shadow] if name != primary]
+        return primary, list(dict.fromkeys(shadows))
+
+    def active(self, name) -> LoadedModel:
+        return self.registries[name].active()
+
+
+def load_router(config_path, model_path: Path, reload_interval=5.0) -> ModelRouter:
+    """
+    Router from a multi-model config, or serving model_path alone.
+    """
+    if config_path:
+        return ModelRouter.from_config(Path(config_path), reload_interval)
+    return ModelRouter({"default": model_path}, "default", (), reload_interval)
@@ -1,10 +1,21 @@
 #!/usr/bin/env python3
+from concurrent.futures import ProcessPoolExecutor
 import noisereduction as nr
+import numpy as np
 import os
 
 WAV_FILE = os.getcwd() + '/example/noisefunkguitare'
 noise_begin, noise_end = 0, 1
 
-noised_audio = nr.Wiener(WAV_FILE, noise_begin, noise_end)
-noised_audio.wiener()
-noised_audio.wiener_two_step()
+if __name__ == '__main__':
+    noised_audio = nr.Wiener.from_file(WAV_FILE, noise_begin, noise_end)
+    noised_audio.wiener()
+    noised_audio.wiener_two_step()
+
+    # The chunks filtered in parallel give the output of the sequential filter
+    mono = nr.Wiener(noised_audio.x[:, 0], noised_audio.FS, noise_begin, noise_end)
+    with ProcessPoolExecutor() as executor:
+        chunked = mono.wiener_two_step_chunks(executor.map, chunk_frames=500)
+    difference = np.abs(chunked - mono.wiener_two_step()).max()
+    print(f'Chunked two step filter, maximum difference : {difference:.2e}')
+    assert difference < 1e-12
@@ -9,16 +9,77 @@ def halfwave_rectification(array):
     Function that computes the half wave rectification with a threshold of 0.
 
     Input :
-        array : 1D np.array, Temporal frame
+        array : np.array, Temporal frame or frames
     Output :
-        halfwave : 1D np.array, Half wave temporal rectification
+        halfwave : np.array, Half wave temporal rectification
 
     """
-    halfwave = np.zeros(array.size)
-    halfwave[np.argwhere(array > 0)] = 1
+    halfwave = np.zeros(array.shape)
+    halfwave[array > 0] = 1
     return halfwave
 
 
+def overlap_add(s_framed, offset):
+    """
+    Function that sums frames starting every offset samples with a single scatter-add.
+
+    Input :
+        s_framed : 2D np.array, Consecutive frames as rows
+        offset : int, Samples between the starts of two frames
+    Output :
+        s_est : 1D np.array, Overlap - add of the frames
+
+    """
+    frame = s_framed.shape[1]
+    index = np.arange(s_framed.shape[0])[:, None]*offset + np.arange(frame)
+    return np.bincount(index.ravel(), weights=s_framed.ravel())
+
+
+class NoisePSD:
+    """
+    Class made for the incremental estimation of the Power Spectral Density of
+    stationnary noise, as the mean of the periodograms of noise frames. Frames
+    can be added in any number of batches, e.g. while a stream is read.
+
+    """
+
+    def __init__(self, NFFT, n_channels=1):
+        """
+        Input :
+            NFFT : int, FFT size of the periodograms
+            n_channels : int, Number of channels
+
+        """
+        self.NFFT = NFFT
+        self.total = np.zeros((NFFT//2 + 1, n_channels))
+        self.count = np.zeros(n_channels, dtype=int)
+
+    def update(self, X_power, channel=0):
+        """
+        Function that adds noise periodograms to the estimate.
+
+            Input :
+                X_power : 2D np.array, Squared magnitude of the NFFT/2 + 1 non negative
+                          frequencies of each frame as rows
+                channel : int, Channel of the frames
+
+        """
+        self.total[:, channel] += X_power.sum(axis=0)
+        self.count[channel] += X_power.shape[0]
+
+    def Sbb(self):
+        """
+        Function that returns the current estimate over all NFFT frequencies.
+
+            Output :
+                Sbb : 2D np.array, Power Spectral Density of stationnary noise per channel
+
+        """
+        Sbb = self.total/self.count
+        # The periodograms of real frames are symmetric
+        return np.concatenate((Sbb, Sbb[-2:0:-1]))
+
+
 class Wiener:
     """
     Class made for wiener filtering based on the article "Improved Signal-to-Noise Ratio Estimation for Speech
@@ -31,18 +92,21 @@ class Wiener:
 
     """
 
-    def __init__(self, WAV_FILE, *T_NOISE):
+    def __init__(self, x, FS, *T_NOISE):
         """
         Input :
-            WAV_FILE
+            x : np.array, Noised signal, 1D (mono) or 2D (samples x channels)
+            FS : int, Sampling rate in Hz
             T_NOISE : float, Time in seconds - Only works if stationnary noise is at the beginning of x
+                      (without T_NOISE, Sbb must be set before filtering)
 
         """
         # Constants are defined here
-        self.WAV_FILE, self.T_NOISE = WAV_FILE, T_NOISE
-        self.FS, self.x = wav.read(self.WAV_FILE + '.wav')
+        self.WAV_FILE = None
+        self.FS, self.x = FS, np.asarray(x)
         self.NFFT, self.SHIFT, self.T_NOISE = 2**10, 0.5, T_NOISE
         self.FRAME = int(0.02*self.FS)  # Frame of 20 ms
+        self.BLOCK = 1024  # Frames filtered at once, bounds the memory of long signals
 
         # Computes the offset and number of frames for overlapp - add method.
         self.OFFSET = int(self.SHIFT*self.FRAME)
@@ -56,7 +120,23 @@ class Wiener:
         length = self.x.shape[0] if len(self.channels) > 1 else self.x.size
         self.frames = np.arange((length - self.FRAME) // self.OFFSET + 1)
         # Evaluating noise psd with n_noise
-        self.Sbb = self.welchs_periodogram()
+        self.Sbb = self.welchs_periodogram() if T_NOISE else None
+
+    @classmethod
+    def from_file(cls, WAV_FILE, *T_NOISE):
+        """
+        Wiener filter of the signal in WAV_FILE + '.wav', whose outputs are also
+        written next to it.
+
+        Input :
+            WAV_FILE : str, Path of the wav file without extension
+            T_NOISE : float, Time in seconds - Only works if stationnary noise is at the beginning of x
+
+        """
+        FS, x = wav.read(WAV_FILE + '.wav')
+        wiener = cls(x, FS, *T_NOISE)
+        wiener.WAV_FILE = WAV_FILE
+        return wiener
 
     @staticmethod
     def a_posteriori_gain(SNR):
@@ -86,58 +166,147 @@ class Wiener:
         G = SNR/(SNR + 1)
         return G
 
+    @staticmethod
+    def two_step_gain(X_power, S_power_last, Sbb, EW):
+        """
+        Function that computes the gain of the Two Step Noise Reduction of consecutive frames.
+
+            Input :
+                X_power : 2D np.array, Squared magnitude of the spectrum of each frame as rows
+                S_power_last : 2D np.array, Power of the Wiener filter output at the frame
+                               preceding the first row (one row)
+                Sbb : np.array, Power Spectral Density of the noise, for all rows or per row
+                EW : float, Energy of the window
+            Output :
+                G_tsnr : 2D np.array, Gain of each frame
+                S_power : 2D np.array, Power of the Wiener filter output of each frame
+
+        """
+        # Typical constant used to determine SNR_dd_prio
+        beta = 0.98
+
+        ############# Wiener Filter ########################################
+        # Computation of spectral gain G using SNR a posteriori
+        SNR_post = X_power/EW/Sbb
+        G = Wiener.a_priori_gain(SNR_post)
+        S_power = G**2 * X_power
+
+        ############# Directed Decision ####################################
+        # Computation of spectral gain G_dd using output S of Wiener Filter
+        # at the previous frame, which only depends on that frame
+        S_power_prev = np.concatenate((S_power_last, S_power[:-1]))
+        SNR_dd_prio = beta*S_power_prev/Sbb + (
+            1 - beta)*halfwave_rectification(SNR_post - 1)
+        G_dd = Wiener.a_priori_gain(SNR_dd_prio)
+
+        ############# Two Step Noise Reduction #############################
+        # Computation of spectral gain G_tsnr using output S_dd = G_dd * X_framed
+        # of Directed Decision
+        SNR_tsnr_prio = G_dd**2 * X_power/Sbb
+        G_tsnr = Wiener.a_priori_gain(SNR_tsnr_prio)
+        return G_tsnr, S_power
+
     def welchs_periodogram(self):
         """
         Estimation of the Power Spectral Density (Sbb) of the stationnary noise
         with Welch's periodogram given prior knowledge of n_noise points where
-        speech is absent.
+        speech is absent. The noise frames are framed at once and their
+        periodograms averaged in one reduction per block of frames.
 
             Output :
-                Sbb : 1D np.array, Power Spectral Density of stationnary noise
+                Sbb : 2D np.array, Power Spectral Density of stationnary noise per channel
 
         """
-        # Initialising Sbb
-        Sbb = np.zeros((self.NFFT, self.channels.size))
-
         self.N_NOISE = int(
             self.T_NOISE[0]*self.FS), int(self.T_NOISE[1]*self.FS)
-        # Number of frames used for the noise
-        noise_frames = np.arange(
-            ((self.N_NOISE[1] - self.N_NOISE[0])-self.FRAME) // self.OFFSET + 1)
-        for channel in self.channels:
-            for frame in noise_frames:
-                i_min, i_max = frame*self.OFFSET + \
-                    self.N_NOISE[0], frame*self.OFFSET + \
-                    self.FRAME + self.N_NOISE[0]
-                # Adaptable indexing for mono (1D) or stereo (2D)
-                if self.x.ndim > 1:
-                    x_framed = self.x[i_min:i_max, channel] * self.WINDOW
-                else:
-                    x_framed = self.x[i_min:i_max] * self.WINDOW
-                # x_framed = self.x[i_min:i_max, channel]*self.WINDOW
-                X_framed = fft(x_framed, self.NFFT)
-                Sbb[:, channel] = frame * Sbb[:, channel] / \
-                    (frame + 1) + np.abs(X_framed)**2 / (frame + 1)
-        return Sbb
+        return self.noise_psd(self.OFFSET).Sbb()
 
     def moving_average(self):
-        # Initialising Sbb
-        Sbb = np.zeros((self.NFFT, self.channels.size))
-        # Number of frames used for the noise
-        noise_frames = np.arange((self.N_NOISE - self.FRAME) + 1)
+        """
+        Estimation of the Power Spectral Density (Sbb) of the stationnary noise
+        averaging the periodograms of frames starting at every sample of the
+        n_noise points where speech is absent.
+
+            Output :
+                Sbb : 2D np.array, Power Spectral Density of stationnary noise per channel
+
+        """
+        return self.noise_psd(1).Sbb()
+
+    def noise_psd(self, hop):
+        """
+        Function that averages the periodograms of the frames of the noise
+        segment taken every hop samples.
+
+            Input :
+                hop : int, Samples between the starts of two noise frames
+            Output :
+                noise : NoisePSD, Estimate over the noise frames
+
+        """
+        noise = NoisePSD(self.NFFT, self.channels.size)
         for channel in self.channels:
-            for frame in noise_frames:
-                # Adaptable indexing for mono (1D) or stereo (2D)
-                if self.x.ndim > 1:
-                    x_framed = self.x[frame:frame +
-                                      self.FRAME, channel] * self.WINDOW
-                else:
-                    x_framed = self.x[frame:frame + self.FRAME] * self.WINDOW
-                # x_framed = self.x[frame:frame +
-                    # self.FRAME, channel]*self.WINDOW
-                X_framed = fft(x_framed, self.NFFT)
-                Sbb[:, channel] += np.abs(X_framed)**2
-        return Sbb/noise_frames.size
+            n_frames = (self.N_NOISE[1] - self.N_NOISE[0] - self.FRAME) // hop + 1
+            for start in range(0, n_frames, self.BLOCK):
+                frames = slice(start, min(start + self.BLOCK, n_frames))
+                _, X_power = self.spectrum(channel, frames, hop, self.N_NOISE[0])
+                noise.update(X_power, channel)
+        return noise
+
+    def framed(self, channel, frames, hop=None, first=0):
+        """
+        Function that frames a channel with a Hanning window, from a strided view of x.
+
+            Input :
+                channel : int, Channel of x
+                frames : slice, Frames to return
+                hop : int, Samples between the starts of two frames (default OFFSET)
+                first : int, Sample where the first frame starts
+            Output :
+                x_framed : 2D np.array, Windowed frames as rows
+
+        """
+        # Adaptable indexing for mono (1D) or stereo (2D)
+        x = self.x[first:, channel] if self.x.ndim > 1 else self.x[first:]
+        windows = np.lib.stride_tricks.sliding_window_view(x, self.FRAME)[::hop or self.OFFSET]
+        return windows[frames] * self.WINDOW
+
+    def spectrum(self, channel, frames, hop=None, first=0):
+        """
+        Function that computes the zero padded FFT of windowed frames. x is real, so
+        only the NFFT/2 + 1 non negative frequencies are kept: real gains preserve
+        the hermitian symmetry and the inverse rfft equals the real part of the
+        full inverse FFT.
+
+            Input :
+                channel : int, Channel of x
+                frames : slice, Frames to transform
+                hop, first : int, Framing of x as in framed
+            Output :
+                X_framed : 2D np.array, Spectrum of each frame as rows
+                X_power : 2D np.array, Its squared magnitude
+
+        """
+        X_framed = np.fft.rfft(self.framed(channel, frames, hop, first), self.NFFT)
+        return X_framed, X_framed.real**2 + X_framed.imag**2
+
+    def overlap_add(self, s_est, channel, start, s_framed):
+        """
+        Function that adds consecutive estimated frames to s_est with a single scatter-add.
+
+            Input :
+                s_est : np.array, Estimated signal, updated in place
+                channel : int, Channel of s_est
+                start : int, Frame of the first row of s_framed
+                s_framed : 2D np.array, Estimated frames as rows
+
+        """
+        s_block = overlap_add(s_framed, self.OFFSET)
+        i_min, i_max = start*self.OFFSET, start*self.OFFSET + s_block.size
+        if s_est.ndim > 1:
+            s_est[i_min:i_max, channel] += s_block
+        else:
+            s_est[i_min:i_max] += s_block
 
     def wiener(self):
         """
@@ -145,108 +314,311 @@ class Wiener:
         by applying a Wiener Filter on each frame to the noised input signal.
 
             Output :
-                s_est : 1D np.array, Estimated speech signal
+                s_est : np.array, Estimated speech signal normalized by its maximum
 
         """
         # Initialising estimated signal s_est
         s_est = np.zeros(self.x.shape)
         for channel in self.channels:
-            for frame in self.frames:
-                ############# Initialising Frame ###################################
-                # Temporal framing with a Hanning window
-                i_min, i_max = frame*self.OFFSET, frame*self.OFFSET + self.FRAME
-                # Adaptable indexing for mono (1D) or stereo (2D)
-                if self.x.ndim > 1:
-                    x_framed = self.x[i_min:i_max, channel] * self.WINDOW
-                else:
-                    x_framed = self.x[i_min:i_max] * self.WINDOW
-                # x_framed = self.x[i_min:i_max, channel]*self.WINDOW
-                # Zero padding x_framed
-                X_framed = fft(x_framed, self.NFFT)
+            Sbb = self.Sbb[:self.NFFT//2 + 1, channel]
+            for start in range(0, self.frames.size, self.BLOCK):
+                ############# Initialising Frames ##################################
+                # Temporal framing with a Hanning window, zero padded FFT of each frame
+                X_framed, X_power = self.spectrum(channel, slice(start, start + self.BLOCK))
 
                 ############# Wiener Filter ########################################
                 # Apply a priori wiener gains G to X_framed to get output S
-                SNR_post = (np.abs(X_framed)**2/self.EW)/self.Sbb[:, channel]
+                SNR_post = (X_power/self.EW)/Sbb
                 G = Wiener.a_priori_gain(SNR_post)
                 S = X_framed * G
 
                 ############# Temporal estimated Signal ############################
-                # Estimated signals at each frame normalized by the shift value
-                temp_s_est = np.real(ifft(S)) * self.SHIFT
-                # Truncating zero padding
-                # s_est[i_min:i_max, channel] += temp_s_est[:self.FRAME]
-                if s_est.ndim > 1:
-                    s_est[i_min:i_max, channel] += temp_s_est[:self.FRAME]
-                else:
-                    s_est[i_min:i_max] += temp_s_est[:self.FRAME]
-        wav.write(self.WAV_FILE+'_wiener.wav', self.FS, s_est/s_est.max())
-
-    def wiener_two_step(self):
+                # Estimated signals at each frame normalized by the shift value,
+                # truncating zero padding
+                temp_s_est = np.fft.irfft(S, self.NFFT) * self.SHIFT
+                self.overlap_add(s_est, channel, start, temp_s_est[:, :self.FRAME])
+        s_est = s_est/s_est.max()
+        if self.WAV_FILE is not None:
+            wav.write(self.WAV_FILE+'_wiener.wav', self.FS, s_est)
+        return s_est
+
+    def two_step_estimate(self, S_power_last=None):
         """
-        Function that returns the estimated speech signals using overlapp - add method
-        by applying a Two Step Noise Reduction on each frame (s_est_tsnr) to the noised input signal (x).
+        Function that returns the estimated speech signal of the Two Step Noise Reduction,
+        before its normalization.
 
+            Input :
+                S_power_last : 2D np.array, Power of the Wiener filter output at the frame
+                               preceding x (one row), when x continues a longer signal
             Output :
-                s_est_tsnr, s_est_hrnr : 1D np.array, 1D np.array
+                s_est_tsnr : np.array, Estimated speech signal
 
         """
-        # Typical constant used to determine SNR_dd_prio
-        beta = 0.98
-
         # Initialising output estimated signal
         s_est_tsnr = np.zeros(self.x.shape)
 
-        # Initialising matrix to store previous values.
-        # For readability purposes, -1 represents past frame values and 0 represents actual frame values.
-        S = np.zeros((2, self.NFFT), dtype='complex')
+        # Power of the Wiener filter output S at the frame preceding the current
+        # block, zero before the signal starts. As in a frame by frame loop, the
+        # first frame of a channel follows the last frame of the previous channel.
+        if S_power_last is None:
+            S_power_last = np.zeros((1, self.NFFT//2 + 1))
         for channel in self.channels:
-            for frame in self.frames:
-                ############# Initialising Frame ###################################
-                # Temporal framing with a Hanning window
-                i_min, i_max = frame*self.OFFSET, frame*self.OFFSET + self.FRAME
-                # Adaptable indexing for mono (1D) or stereo (2D)
-                if self.x.ndim > 1:
-                    x_framed = self.x[i_min:i_max, channel] * self.WINDOW
-                else:
-                    x_framed = self.x[i_min:i_max] * self.WINDOW
-                # x_framed = self.x[i_min:i_max, channel]*self.WINDOW
-
-                # Zero padding x_framed
-                X_framed = fft(x_framed, self.NFFT)
+            Sbb = self.Sbb[:self.NFFT//2 + 1, channel]
+            for start in range(0, self.frames.size, self.BLOCK):
+                ############# Initialising Frames ##################################
+                # Temporal framing with a Hanning window, zero padded FFT of each frame
+                X_framed, X_power = self.spectrum(channel, slice(start, start + self.BLOCK))
 
-                ############# Wiener Filter ########################################
-                # Computation of spectral gain G using SNR a posteriori
-                SNR_post = np.abs(X_framed)**2/self.EW/self.Sbb[:, channel]
-                G = Wiener.a_priori_gain(SNR_post)
-                S[0, :] = G * X_framed
-
-                ############# Directed Decision ####################################
-                # Computation of spectral gain G_dd using output S of Wiener Filter
-                SNR_dd_prio = beta*np.abs(S[-1, :])**2/self.Sbb[:, channel] + (
-                    1 - beta)*halfwave_rectification(SNR_post - 1)
-                G_dd = Wiener.a_priori_gain(SNR_dd_prio)
-                S_dd = G_dd * X_framed
-
-                ############# Two Step Noise Reduction #############################
-                # Computation of spectral gain G_tsnr using output S_dd of Directed Decision
-                SNR_tsnr_prio = np.abs(S_dd)**2/self.Sbb[:, channel]
-                G_tsnr = Wiener.a_priori_gain(SNR_tsnr_prio)
+                G_tsnr, S_power = Wiener.two_step_gain(X_power, S_power_last, Sbb, self.EW)
                 S_tsnr = G_tsnr * X_framed
 
                 ############# Temporal estimated Signal ############################
-                # Estimated signal at frame normalized by the shift value
-                temp_s_est_tsnr = np.real(ifft(S_tsnr))*self.SHIFT
-                # Truncating zero padding
-                # s_est_tsnr[i_min:i_max,
-                #            channel] += temp_s_est_tsnr[:self.FRAME]
-                if s_est_tsnr.ndim > 1:
-                    s_est_tsnr[i_min:i_max,
-                               channel] += temp_s_est_tsnr[:self.FRAME]
-                else:
-                    s_est_tsnr[i_min:i_max] += temp_s_est_tsnr[:self.FRAME]
+                # Estimated signal at each frame normalized by the shift value,
+                # truncating zero padding
+                temp_s_est_tsnr = np.fft.irfft(S_tsnr, self.NFFT)*self.SHIFT
+                self.overlap_add(s_est_tsnr, channel, start, temp_s_est_tsnr[:, :self.FRAME])
 
                 ############# Update ###############################################
-                # Rolling matrix to update old values (Circshift in Matlab)
-                S = np.roll(S, 1, axis=0)
-        wav.write(self.WAV_FILE+'_wiener_two_step.wav',
-                  self.FS, s_est_tsnr/s_est_tsnr.max())
+                S_power_last = S_power[-1:]
+        return s_est_tsnr
+
+    def previous_frame_power(self, previous):
+        """
+        Function that computes the power of the Wiener filter output of the frame
+        preceding x, which only depends on that frame.
+
+            Input :
+                previous : 1D np.array, Samples of the frame preceding x (mono)
+            Output :
+                S_power_last : 2D np.array, Power of the Wiener filter output (one row)
+
+        """
+        X_framed = np.fft.rfft((previous * self.WINDOW)[None, :], self.NFFT)
+        X_power = X_framed.real**2 + X_framed.imag**2
+        SNR_post = X_power/self.EW/self.Sbb[:self.NFFT//2 + 1, 0]
+        return Wiener.a_priori_gain(SNR_post)**2 * X_power
+
+    def wiener_two_step_chunks(self, map=map, chunk_frames=3000):
+        """
+        Function that returns the estimated speech signal of wiener_two_step, filtering
+        chunks of chunk_frames frames of a mono signal with map, e.g. the map of a
+        process pool, and the noise psd of the whole signal.
+
+        Chunks hold whole frames and adjacent chunks overlap by the half frame shared
+        by their boundary frames, so the Hanning windowed overlapp - add of these
+        frames crossfades the chunks. Each chunk recomputes the Wiener filter output
+        of the frame preceding it, the only state carried from frame to frame, so
+        the output matches the sequential filter up to rounding.
+
+            Input :
+                map : function, map(function, *iterables) running the chunks
+                chunk_frames : int, Frames of each chunk
+            Output :
+                s_est_tsnr : 1D np.array, Estimated speech signal normalized by its maximum
+
+        """
+        starts = range(0, self.frames.size, chunk_frames)
+        chunks = [
+            self.x[start*self.OFFSET:(min(start + chunk_frames, self.frames.size) - 1)*self.OFFSET + self.FRAME]
+            for start in starts
+        ]
+        previous = [
+            None if start == 0 else self.x[(start - 1)*self.OFFSET:(start - 1)*self.OFFSET + self.FRAME]
+            for start in starts
+        ]
+
+        s_est_tsnr = np.zeros(self.x.shape)
+        estimates = map(two_step_chunk, chunks, [self.FS]*len(chunks), [self.Sbb]*len(chunks), previous)
+        for start, s_chunk in zip(starts, estimates):
+            s_est_tsnr[start*self.OFFSET:start*self.OFFSET + s_chunk.size] += s_chunk
+        s_est_tsnr = s_est_tsnr/s_est_tsnr.max()
+        if self.WAV_FILE is not None:
+            wav.write(self.WAV_FILE+'_wiener_two_step.wav', self.FS, s_est_tsnr)
+        return s_est_tsnr
+
+    def wiener_two_step(self):
+        """
+        Function that returns the estimated speech signals using overlapp - add method
+        by applying a Two Step Noise Reduction on each frame (s_est_tsnr) to the noised input signal (x).
+
+            Output :
+                s_est_tsnr : np.array, Estimated speech signal normalized by its maximum
+
+        """
+        s_est_tsnr = self.two_step_estimate()
+        s_est_tsnr = s_est_tsnr/s_est_tsnr.max()
+        if self.WAV_FILE is not None:
+            wav.write(self.WAV_FILE+'_wiener_two_step.wav', self.FS, s_est_tsnr)
+        return s_est_tsnr
+
+
+def two_step_chunk(x, FS, Sbb, previous=None):
+    """
+    Function that returns the Two Step Noise Reduction estimate of a chunk of a mono
+    signal, before normalization, given the noise psd of the whole signal.
+
+    Input :
+        x : 1D np.array, Chunk starting at a frame of the whole signal
+        FS : int, Sampling rate in Hz
+        Sbb : 2D np.array, Power Spectral Density of stationnary noise
+        previous : 1D np.array, Samples of the frame preceding the chunk, None for the first chunk
+    Output :
+        s_est_tsnr : 1D np.array, Estimated speech signal of the chunk
+
+    """
+    wiener = Wiener(x, FS)
+    wiener.Sbb = Sbb
+    S_power_last = None if previous is None else wiener.previous_frame_power(previous)
+    return wiener.two_step_estimate(S_power_last)
+
+
+class OnlineWiener:
+    """
+    Class made for two step wiener filtering of a mono stream, block by block, with
+    the gains of Wiener.wiener_two_step.
+
+    Between blocks it keeps the samples of the next frames, the overlapp - add tail
+    of the frames already filtered, the filtered samples not output yet, the Wiener
+    filter output of the last frame and the noise psd. The first T_NOISE seconds are
+    taken as stationnary noise: their frames are filtered with the mean periodogram
+    of the noise frames seen so far, later frames with the estimate over the whole
+    noise segment.
+
+    Every block gives as many output samples, delayed by latency = FRAME - 1 samples,
+    one 20 ms frame less one sample: the output starts with latency zeros and flush
+    returns the last latency samples. After the noise segment and one more frame the
+    delayed output equals Wiener(x, FS, 0, T_NOISE).wiener_two_step() up to rounding,
+    before its normalization by the maximum.
+
+    """
+
+    def __init__(self, FS, T_NOISE=0.5):
+        """
+        Input :
+            FS : int, Sampling rate in Hz
+            T_NOISE : float, Time in seconds of stationnary noise at the beginning of the stream
+
+        """
+        # Constants are defined here, as in Wiener
+        self.FS = FS
+        self.NFFT, self.SHIFT = 2**10, 0.5
+        self.FRAME = int(0.02*self.FS)  # Frame of 20 ms
+        self.OFFSET = int(self.SHIFT*self.FRAME)
+        self.WINDOW = np.hanning(self.FRAME)
+        self.EW = np.sum(self.WINDOW)
+
+        # Number of frames used for the noise
+        self.noise_frames = (int(T_NOISE*self.FS) - self.FRAME) // self.OFFSET + 1
+        if self.noise_frames < 1:
+            raise ValueError(f"T_NOISE must cover at least one {self.FRAME} samples frame")
+        self.noise = NoisePSD(self.NFFT)
+
+        # State carried between blocks
+        self.x = np.zeros(0)  # input from the start of the next frame
+        self.tail = np.zeros(self.FRAME - self.OFFSET)  # overlapp - add of unfinished samples
+        self.S_power_last = np.zeros((1, self.NFFT//2 + 1))
+        self.frame = 0  # index of the next frame
+        self.out = np.zeros(self.latency)  # filtered samples not output yet
+
+    @property
+    def latency(self):
+        """
+        Number of samples the output lags behind the input, the longest wait
+        before a sample is covered by every frame it belongs to.
+        """
+        return self.FRAME - 1
+
+    def noise_psd(self, X_power):
+        """
+        Function that updates the noise psd with the noise frames among the new frames.
+
+            Input :
+                X_power : 2D np.array, Squared magnitude of the spectrum of each new frame
+            Output :
+                Sbb : np.array, Noise psd of every new frame (rows) or of all of them
+
+        """
+        noisy = min(max(self.noise_frames - self.frame, 0), X_power.shape[0])
+        if noisy == 0:
+            return self.noise.total[:, 0]/self.noise.count[0]
+
+        # Running mean including each noise frame, as if frames came one by one
+        total = self.noise.total[:, 0] + np.cumsum(X_power[:noisy], axis=0)
+        Sbb_noisy = total/(self.noise.count[0] + np.arange(1, noisy + 1))[:, None]
+        self.noise.update(X_power[:noisy])
+
+        Sbb = self.noise.total[:, 0]/self.noise.count[0]
+        return np.concatenate((Sbb_noisy, np.broadcast_to(Sbb, (X_power.shape[0] - noisy, Sbb.size))))
+
+    def process(self, block):
+        """
+        Function that filters the next block of the stream.
+
+            Input :
+                block : 1D np.array, Next samples of the noised signal
+            Output :
+                s_est : 1D np.array, Estimated signal of len(block) samples, lagging
+                        the input by latency samples
+
+        """
+        self.x = np.concatenate((self.x, block))
+        n = max((self.x.size - self.FRAME) // self.OFFSET + 1, 0)
+        if n > 0:
+            self.out = np.concatenate((self.out, self.filter_frames(n)))
+
+        # At most latency samples of the input are not filtered yet
+        s_est, self.out = self.out[:block.size], self.out[block.size:]
+        return s_est
+
+    def filter_frames(self, n):
+        """
+        Function that filters the next n complete frames of the input buffer.
+
+            Output :
+                s_est : 1D np.array, Estimated signal up to the start of the next frame
+
+        """
+        ############# Initialising Frames ##################################
+        windows = np.lib.stride_tricks.sliding_window_view(self.x, self.FRAME)[::self.OFFSET]
+        X_framed = np.fft.rfft(windows[:n] * self.WINDOW, self.NFFT)
+        X_power = X_framed.real**2 + X_framed.imag**2
+
+        G_tsnr, S_power = Wiener.two_step_gain(
+            X_power, self.S_power_last, self.noise_psd(X_power), self.EW)
+
+        ############# Temporal estimated Signal ############################
+        temp_s_est_tsnr = np.fft.irfft(G_tsnr * X_framed, self.NFFT)*self.SHIFT
+        s_est = overlap_add(temp_s_est_tsnr[:, :self.FRAME], self.OFFSET)
+        s_est[:self.tail.size] += self.tail
+
+        ############# Update ###############################################
+        self.tail = s_est[n*self.OFFSET:]
+        self.x = self.x[n*self.OFFSET:]
+        self.S_power_last = S_power[-1:]
+        self.frame += n
+        return s_est[:n*self.OFFSET]
+
+    def flush(self):
+        """
+        Function that ends the stream.
+
+            Output :
+                s_est : 1D np.array, Estimated signal of the last latency samples, zero
+                        where no complete frame covers them as in Wiener
+
+        """
+        rest = np.zeros(self.x.size)
+        rest[:self.tail.size] = self.tail[:self.x.size]
+        s_est = np.concatenate((self.out, rest))
+        self.x = np.zeros(0)
+        self.tail = np.zeros(self.FRAME - self.OFFSET)
+        self.out = np.zeros(self.latency)
+        return s_est
+
+    def stream(self, blocks):
+        """
+        Generator of the estimated signal of a stream of blocks, ending with flush.
+        """
+        for block in blocks:
+            yield self.process(np.asarray(block, dtype=float))
+        yield self.flush()
@@ -1,5 +1,8 @@
-import tempfile
 from .noise_reduction.noisereduction import Wiener
+from globals import MAX_WORKERS, NOISE_REDUCTION_CHUNK
+
+from concurrent.futures import ProcessPoolExecutor
+import threading
 
 import librosa
 from pathlib import Path
@@ -75,63 +78,52 @@ def background_noise_removal(y, sr):
     return y_clean
 
 
+# Process pool of the chunked Wiener filter, shared by every request
+wiener_executor = None
+wiener_executor_lock = threading.Lock()
 
-def wiener_noise_reduction(y, sr):
-    print("Background noise reduction: active (using Wiener Filter)")
 
-    # The Wiener filter class works on files, so we create a temporary one.
-    with tempfile.TemporaryDirectory() as temp_dir:
-        temp_dir_path = Path(temp_dir)
-        # Create a temporary path for the noisy input file
-        temp_noisy_path = temp_dir_path / "temp_noisy_audio.wav"
-
-        # Save the in-memory audio array 'y' to the temporary file
-        sf.write(temp_noisy_path, y, sr)
-
-        # --- NEW: Wiener Filter Implementation ---
-        try:
-            # The Wiener class constructor needs the base filename (without extension)
-            # and the start/end time of a known noise segment.
-            # We ASSUME the first 0.5 seconds of the recording is stationary noise.
-            noise_start_time = 0.0
-            noise_end_time = 0.5
-
-            # Check if the audio is long enough for the noise profile
-            if len(y) / sr > noise_end_time:
-                print(f"Using first {noise_end_time}s for noise profile.")
-                # Instantiate the filter
-                wiener_filter = Wiener(
-                    str(temp_noisy_path.with_suffix("")),
-                    noise_start_time,
-                    noise_end_time,
-                )
+def wiener_pool():
+    """
+    The shared process pool of the chunked Wiener filter, started on first use.
+    """
+    global wiener_executor
+    with wiener_executor_lock:
+        if wiener_executor is None:
+            wiener_executor = ProcessPoolExecutor(max_workers=int(MAX_WORKERS))
+        return wiener_executor
 
-                # Apply the two-step Wiener filter. This saves a new file.
-                wiener_filter.wiener_two_step()
 
-                # Define the path where the cleaned file was saved
-                # The class appends '_wiener_two_step.wav' to the original name
-                cleaned_file_path = (
-                    temp_dir_path / f"{temp_noisy_path.stem}_wiener_two_step.wav"
-                )
+def wiener_noise_reduction(y, sr):
+    print("Background noise reduction: active (using Wiener Filter)")
 
-                if cleaned_file_path.exists():
-                    # Load the cleaned audio data back into our 'y' variable
-                    y, _ = sf.read(cleaned_file_path)
-                    print("Wiener filtering applied successfully.")
-                else:
-                    print(
-                        "Warning: Wiener filter output file not found. Skipping noise reduction."
-                    )
+    try:
+        # The Wiener filter needs the start/end time of a known noise segment.
+        # We ASSUME the first 0.5 seconds of the recording is stationary noise.
+        noise_start_time = 0.0
+        noise_end_time = 0.5
+
+        # Check if the audio is long enough for the noise profile
+        if len(y) / sr > noise_end_time:
+            print(f"Using first {noise_end_time}s for noise profile.")
+            # Apply the two-step Wiener filter to the in-memory audio
+            wiener_filter = Wiener(y, sr, noise_start_time, noise_end_time)
+            chunk_frames = int(NOISE_REDUCTION_CHUNK * sr) // wiener_filter.OFFSET
+            if chunk_frames and wiener_filter.frames.size > chunk_frames and int(MAX_WORKERS) > 1:
+                # Long recordings: chunks in parallel with the noise profile of the
+                # first 0.5 s, same output as the sequential filter
+                y = wiener_filter.wiener_two_step_chunks(wiener_pool().map, chunk_frames)
             else:
-                print(
-                    "Warning: Audio too short for noise profiling. Skipping noise reduction."
-                )
-
-        except Exception as e:
-            print(f"An error occurred during Wiener filtering: {e}")
-            print("Skipping noise reduction and proceeding with original audio.")
-    # The temporary directory and its contents are automatically deleted here.
+                y = wiener_filter.wiener_two_step()
+            print("Wiener filtering applied successfully.")
+        else:
+            print(
+                "Warning: Audio too short for noise profiling. Skipping noise reduction."
+            )
+
+    except Exception as e:
+        print(f"An error occurred during Wiener filtering: {e}")
+        print("Skipping noise reduction and proceeding with original audio.")
     return y, sr
 
 
@@ -167,13 +159,23 @@ def preprocess_audio(
 
     print(f"Processing audio file: {input_file}")
 
-    input_file = check_audio_extension(input_file)
+    y, sr = load_preprocessed_audio(input_file, noise_removal_flag, target_sr)
+    segments = segment_audio(y, sr, output_dir, segment_length)
+
+    return segments, sr
 
-    # Output of subdirectory
-    segmented_dir = output_dir / "segmented_audio"
-    if segmented_dir.exists():
-        shutil.rmtree(segmented_dir)
-    segmented_dir.mkdir(parents=True, exist_ok=True)
+
+def load_preprocessed_audio(input_file, noise_removal_flag=False, target_sr=16000):
+    """
+    Loads an audio file as mono, resamples it to target_sr and applies the
+    optional noise removal, i.e. everything preprocess_audio does before
+    segmentation.
+
+    Returns:
+        np.ndarray: The whole preprocessed recording.
+        int: Its sampling rate.
+    """
+    input_file = check_audio_extension(input_file)
 
     # Load and resample audio
     y, sr = load_audio_with_soundfile(input_file)
@@ -196,16 +198,34 @@ def preprocess_audio(
     else:
         print("Background noise reduction: inactive")
 
-    # Get the base filename of the audio (excluding extension)
-    audio_filename = Path(input_file).stem
+    return y, sr
+
+
+def segment_audio(y, sr, output_dir=Path(""), segment_length=15, hop_length=None):
+    """
+    Splits a preprocessed recording into full-length segments and saves them
+    under output_dir/segmented_audio. Segments start every hop_length seconds
+    (default: segment_length, i.e. non-overlapping).
+
+    Returns:
+        list: The audio segments (NumPy arrays).
+    """
+    # Output of subdirectory
+    segmented_dir = output_dir / "segmented_audio"
+    if segmented_dir.exists():
+        shutil.rmtree(segmented_dir)
+    segmented_dir.mkdir(parents=True, exist_ok=True)
 
     # Calculate segment length in samples
     segment_samples = segment_length * sr
+    hop_samples = round((segment_length if hop_length is None else hop_length) * sr)
+    if hop_samples < 1:
+        raise ValueError(f"Hop of {hop_length} s is shorter than one sample")
 
     # Split and save segments
     segments = []
 
-    for i, start in enumerate(range(0, len(y), segment_samples)):
+    for i, start in enumerate(range(0, len(y), hop_samples)):
         end = start + segment_samples
         segment = y[start:end]
         if len(segment) == segment_samples:  # includes full-length segments only
@@ -219,4 +239,4 @@ def preprocess_audio(
                     sr,
                 )
 
-    return segments, sr
+    return segments
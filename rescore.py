@@ -0,0 +1,217 @@
+"""
+Offline re-scoring of stored segment features.
+
+Reads per-segment STRF features, either the {"strf", "fs"} pickles written
+by run_extraction.feature_extract_dir or the .npy entries of a feature
+store, scores them with an old and a new model in batches across a process
+pool, and writes a CSV with one row per recording comparing the decisions
+of both models.
+
+Segment files carry no reliable recording id: feature_extract_dir writes
+<segment file stem>_strf.pkl into one flat directory and feature store
+entries are content addressed. The recording of a segment is taken from a
+--recordings CSV (file path relative to FEATURES_DIR, recording) when
+given, else from a <recording>_segment_<n>_strf.pkl name, as written for
+segment files named <recording>_segment_<n>.wav. Segments matching neither
+are reported on their own, one row each.
+
+Usage:
+    python rescore.py FEATURES_DIR OUTPUT.csv --new NEW_MODEL [--old OLD_MODEL]
+        [--recordings RECORDINGS.csv]
+"""
+
+import argparse
+import csv
+import pickle
+import re
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from globals import MAX_WORKERS, MODEL_PATH
+from inference import (
+    adjusted_confidence,
+    expected_features,
+    normalize_features,
+    score_features,
+)
+from model_registry import load_model
+from profiler import profile
+
+# models of each worker process, loaded once by init_worker
+models = {}
+
+
+def find_feature_files(features_dir: Path):
+    return sorted([*features_dir.rglob("*_strf.pkl"), *features_dir.rglob("*.npy")])
+
+
+def load_features(path: Path):
+    if path.suffix == ".npy":
+        return np.load(path)
+    with open(path, "rb") as f:
+        return pickle.load(f)["strf"]
+
+
+def load_recordings(recordings_file: Path):
+    """
+    {segment file relative to the features directory: recording} of a CSV
+    with file and recording columns.
+    """
+    with open(recordings_file, newline="") as f:
+        return {row["file"]: row["recording"] for row in csv.DictReader(f)}
+
+
+def recording_of(path: Path, features_dir: Path, recordings=None):
+    relative = str(path.relative_to(features_dir))
+    if recordings and relative in recordings:
+        return recordings[relative]
+    match = re.fullmatch(r"(.+)_segment_\d+_strf", path.stem)
+    if path.suffix == ".pkl" and match:
+        return str(path.parent.relative_to(features_dir) / match.group(1))
+    # unknown recording, reported per segment
+    return relative
+
+
+def recording_class(score):
+    if score == 50:
+        return "balanced"
+    return "post" if score > 50 else "pre"
+
+
+def init_worker(model_paths):
+    for name, path in model_paths.items():
+        models[name] = load_model(path)
+
+
+def score_batch(paths):
+    """
+    Per-segment rows with each model's label, decision value and SD/NSD
+    probabilities.
+    """
+    feature_norm = normalize_features([load_features(path) for path in paths])
+    rows = [{"file": str(path)} for path in paths]
+
+    for name, model in models.items():
+        n_features = expected_features(model.svm, model.pca, model.compiled)
+        if feature_norm.shape[1] != n_features:
+            raise ValueError(
+                f"Feature mismatch for {name} model! "
+                f"Expected {n_features}, got {feature_norm.shape[1]}."
+            )
+
+        classes, y_pred, decision, probs = score_features(
+            feature_norm, model.svm, model.pca, model.compiled
+        )
+        sd_probs = np.zeros(len(paths))
+        nsd_probs = np.zeros(len(paths))
+        if probs is not None:
+            sd_probs = probs[:, list(classes).index("post")]
+            nsd_probs = probs[:, list(classes).index("pre")]
+
+        for i, row in enumerate(rows):
+            row[f"{name}_class"] = str(y_pred[i])
+            row[f"{name}_decision"] = float(decision[i])
+            row[f"{name}_sd_prob"] = float(sd_probs[i])
+            row[f"{name}_nsd_prob"] = float(nsd_probs[i])
+    return rows
+
+
+def summarize(segment_rows, features_dir: Path, model_names, recordings=None):
+    """
+    One row per recording with the predict_features outcome of each model.
+    """
+    grouped = defaultdict(list)
+    for row in segment_rows:
+        grouped[recording_of(Path(row["file"]), features_dir, recordings)].append(row)
+
+    summary = []
+    for recording, rows in grouped.items():
+        entry = {"recording": recording, "segments": len(rows)}
+        for name in model_names:
+            sd_counter = sum(row[f"{name}_class"] == "post" for row in rows)
+            nsd_counter = len(rows) - sd_counter
+            score = adjusted_confidence(
+                sd_counter,
+                nsd_counter,
+                np.mean([row[f"{name}_sd_prob"] for row in rows]),
+                np.mean([row[f"{name}_nsd_prob"] for row in rows]),
+            )
+            entry[f"{name}_class"] = recording_class(score)
+            entry[f"{name}_score"] = float(score)
+            entry[f"{name}_sd_count"] = sd_counter
+        entry["changed"] = entry["old_class"] != entry["new_class"]
+        summary.append(entry)
+    return summary
+
+
+def write_csv(rows, output_file: Path):
+    with open(output_file, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+@profile
+def rescore(
+    features_dir: Path,
+    output_file: Path,
+    model_paths,
+    batch_size,
+    workers,
+    segments_file=None,
+    recordings_file=None,
+):
+    paths = find_feature_files(features_dir)
+    if not paths:
+        raise SystemExit(f"No feature files in {features_dir}")
+    batches = [paths[i : i + batch_size] for i in range(0, len(paths), batch_size)]
+
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=init_worker, initargs=(model_paths,)
+    ) as executor:
+        segment_rows = [
+            row for rows in executor.map(score_batch, batches) for row in rows
+        ]
+
+    recordings = load_recordings(recordings_file) if recordings_file else None
+    summary = summarize(segment_rows, features_dir, list(model_paths), recordings)
+    write_csv(summary, output_file)
+    if segments_file is not None:
+        write_csv(segment_rows, segments_file)
+
+    changed = sum(entry["changed"] for entry in summary)
+    print(f"Scored {len(segment_rows)} segments of {len(summary)} recordings")
+    print(f"Decisions changed: {changed} of {len(summary)}")
+    print(f"Saved summary to: {output_file}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline re-scoring of stored segment features.")
+    parser.add_argument("features_dir", type=Path)
+    parser.add_argument("output_file", type=Path)
+    parser.add_argument("--new", type=Path, required=True, help="model to compare")
+    parser.add_argument("--old", type=Path, default=MODEL_PATH, help="current model")
+    parser.add_argument("--segments", type=Path, help="also write per-segment rows")
+    parser.add_argument(
+        "--recordings", type=Path, help="CSV mapping each segment file to its recording"
+    )
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--workers", type=int, default=int(MAX_WORKERS))
+    args = parser.parse_args()
+
+    rescore(
+        args.features_dir,
+        args.output_file,
+        {"old": args.old, "new": args.new},
+        args.batch_size,
+        args.workers,
+        args.segments,
+        args.recordings,
+    )
+
+
+if __name__ == "__main__":
+    main()
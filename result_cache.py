@@ -0,0 +1,105 @@
+"""
+Cache of classification results for re-uploaded audio.
+
+Entries are JSON files keyed by a hash of the decoded samples, the
+noiseRemoval flag, the model version and the extraction settings, so a
+retried upload skips conversion, preprocessing, feature extraction and
+plotting. A hit hard-links the plot and segment files of the upload that
+produced the result into the directories of the new upload id, since
+clients fetch them by their own id. Each entry records which artifact
+directories its upload had, e.g. screened uploads have no plots.
+
+Entries expire after a TTL and the least recently used ones are evicted
+past a maximum count; eviction only removes cache entries, never the
+artifacts of earlier uploads.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+import soundfile as sf
+
+from feature_extraction.spectrogram_cache import evict_lru
+
+
+class ResultCache:
+    def __init__(self, cache_dir: Path, artifact_dirs, max_entries=1024, ttl=86400):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.artifact_dirs = [Path(d) for d in artifact_dirs]
+        self.max_entries = max_entries
+        self.ttl = ttl
+
+    def key(self, audio_path: Path, noise_removal_flag, model_version, settings):
+        audio, sr = sf.read(audio_path, always_2d=True)
+        h = hashlib.sha256(audio.tobytes())
+        h.update(
+            json.dumps(
+                {
+                    "sr": sr,
+                    "shape": audio.shape,
+                    "noise_removal": noise_removal_flag,
+                    "model_version": model_version,
+                    "settings": settings,
+                },
+                sort_keys=True,
+            ).encode()
+        )
+        return h.hexdigest()
+
+    def get(self, key, uid):
+        """
+        Stored result for key with its artifacts linked to uid, or None.
+        """
+        path = self.cache_dir / f"{key}.json"
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+        if time.time() - entry["created"] > self.ttl:
+            path.unlink(missing_ok=True)
+            return None
+
+        roots = [Path(root) for root in entry.get("artifacts", self.artifact_dirs)]
+        sources = [root / entry["uid"] for root in roots]
+        if not all(source.is_dir() for source in sources):
+            # artifacts of the original upload were cleaned up
+            path.unlink(missing_ok=True)
+            return None
+
+        if entry["uid"] != str(uid):
+            for source, root in zip(sources, roots):
+                shutil.copytree(
+                    source, root / str(uid), copy_function=os.link, dirs_exist_ok=True
+                )
+
+        os.utime(path)
+        print(f"Result cache hit: {key[:12]} (upload {entry['uid']})")
+        return entry["result"]
+
+    def put(self, key, uid, result):
+        entry = {
+            "uid": str(uid),
+            "created": time.time(),
+            "result": result,
+            "artifacts": [
+                str(root) for root in self.artifact_dirs if (root / str(uid)).is_dir()
+            ],
+        }
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(entry, f)
+        os.replace(tmp, self.cache_dir / f"{key}.json")
+        self.evict()
+
+    def evict(self):
+        # mtime is never older than the creation time, so entries idle for
+        # longer than the TTL have expired as well
+        evict_lru(self.cache_dir, "*.json", max_entries=self.max_entries, ttl=self.ttl)
@@ -0,0 +1,131 @@
+"""
+Screening model for two-stage classification.
+
+The screener is a standardized logistic regression on the cheap features of
+run_extraction.extract_screening_features (auditory spectrum and pooled
+modulation power spectrum). It is saved as a {"svm", "pca"} pickle with no
+PCA, so the server loads and scores it like any other model; the full
+STRF+SVM pipeline only runs when its average SD probability falls inside
+the uncertainty band.
+
+Usage:
+    python screening.py train DATA_DIR SCREENER.pkl
+    python screening.py agreement DATA_DIR --screener SCREENER.pkl
+
+DATA_DIR holds 15 s segment .wav files in pre/ and post/ subdirectories,
+e.g. copied from the segmented_audio output of the server.
+"""
+
+import argparse
+import pickle
+from pathlib import Path
+
+import numpy as np
+from sklearn.linear_model import LogisticRegression
+from sklearn.model_selection import cross_val_score
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import StandardScaler
+
+from feature_extraction import utils
+from feature_extraction.run_extraction import (
+    feature_extract_screening,
+    feature_extract_segments,
+)
+from globals import MODEL_PATH, SCREENING_BAND
+from inference import normalize_features, score_features
+from model_registry import load_model
+
+CLASSES = ("post", "pre")
+
+
+def load_dataset(data_dir: Path):
+    """
+    Segment files, their audio and their labels (the parent directory).
+    """
+    files = sorted(
+        path for label in CLASSES for path in (data_dir / label).glob("*.wav")
+    )
+    segments, sample_rates = zip(*(utils.audio_data(path) for path in files))
+    if len(set(sample_rates)) != 1:
+        raise ValueError(f"Mixed sample rates in {data_dir}: {set(sample_rates)}")
+    labels = np.array([path.parent.name for path in files])
+    return files, list(segments), sample_rates[0], labels
+
+
+def train(data_dir: Path, output_file: Path, folds=5):
+    files, segments, sample_rate, labels = load_dataset(data_dir)
+    print(f"Training screener on {len(files)} segments")
+
+    X = normalize_features(feature_extract_screening(segments, sample_rate))
+    screener = make_pipeline(StandardScaler(), LogisticRegression(max_iter=1000))
+
+    accuracy = cross_val_score(screener, X, labels, cv=folds)
+    print(f"Cross-validated accuracy: {accuracy.mean():.3f} (+/- {accuracy.std():.3f})")
+
+    screener.fit(X, labels)
+    with open(output_file, "wb") as f:
+        pickle.dump({"svm": screener, "pca": None}, f)
+    print(f"Saved screener to: {output_file}")
+
+
+def agreement(data_dir: Path, screener_path: Path, model_path: Path, band):
+    """
+    Compare the screener with the full model per segment: overall agreement,
+    the share of segments the band would settle without the full model and
+    the agreement on those.
+    """
+    files, segments, sample_rate, labels = load_dataset(data_dir)
+    screener = load_model(screener_path)
+    model = load_model(model_path)
+
+    X_screen = normalize_features(feature_extract_screening(segments, sample_rate))
+    classes, screen_pred, _, probs = score_features(
+        X_screen, screener.svm, screener.pca, screener.compiled
+    )
+    sd_probs = probs[:, list(classes).index("post")]
+
+    X_full = normalize_features(feature_extract_segments(segments, sample_rate))
+    _, full_pred, _, _ = score_features(X_full, model.svm, model.pca, model.compiled)
+
+    low, high = band
+    settled = (sd_probs <= low) | (sd_probs >= high)
+    agree = screen_pred == full_pred
+
+    print(f"Segments: {len(files)}")
+    print(f"Screener accuracy: {np.mean(screen_pred == labels):.3f}")
+    print(f"Full model accuracy: {np.mean(full_pred == labels):.3f}")
+    print(f"Agreement (all): {np.mean(agree):.3f}")
+    print(f"Settled by screener (band {low}-{high}): {np.mean(settled):.3f}")
+    if settled.any():
+        print(f"Agreement (settled): {np.mean(agree[settled]):.3f}")
+        print(f"Accuracy (settled): {np.mean(screen_pred[settled] == labels[settled]):.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Screening model for two-stage classification.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    train_parser = subparsers.add_parser("train", help="fit a screener")
+    train_parser.add_argument("data_dir", type=Path)
+    train_parser.add_argument("output_file", type=Path)
+    train_parser.add_argument("--folds", type=int, default=5)
+
+    agreement_parser = subparsers.add_parser(
+        "agreement", help="compare a screener with the full model"
+    )
+    agreement_parser.add_argument("data_dir", type=Path)
+    agreement_parser.add_argument("--screener", type=Path, required=True)
+    agreement_parser.add_argument("--model", type=Path, default=MODEL_PATH)
+    agreement_parser.add_argument(
+        "--band", type=float, nargs=2, default=SCREENING_BAND, metavar=("LOW", "HIGH")
+    )
+    args = parser.parse_args()
+
+    if args.command == "train":
+        train(args.data_dir, args.output_file, args.folds)
+    else:
+        agreement(args.data_dir, args.screener, args.model, args.band)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,11 @@
 import io
+import json
 import os
-import pickle
 import sys
+import tempfile
+import threading
 import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from enum import Enum
 from http import HTTPStatus
@@ -14,11 +17,48 @@ from flask_cors import CORS
 from pydub import AudioSegment
 from werkzeug.utils import secure_filename
 
-from feature_extraction.run_extraction import feature_extract_segments
+from feature_extraction.run_extraction import (
+    feature_extract_recording,
+    feature_extract_screening,
+    feature_extract_segments,
+    feature_extract_sequential,
+    feature_extract_sliding,
+)
+from feature_extraction.auditory import frame_aligned
+from feature_extraction.spectrogram_cache import evict_lru
 from feature_extraction.strf_analyzer import STRFAnalyzer
-from preprocess.preprocess import preprocess_audio
+from preprocess.preprocess import load_preprocessed_audio, preprocess_audio, segment_audio
 from profiler import profile
-from globals import OUTDIR
+from inference import (
+    MicroBatcher,
+    adjusted_confidence,
+    expected_features,
+    normalize_features,
+    projection_of,
+    score_features,
+)
+from globals import (
+    EARLY_EXIT,
+    EARLY_EXIT_CONFIDENCE,
+    EARLY_EXIT_MIN_SEGMENTS,
+    MICROBATCH_MAX_ROWS,
+    MICROBATCH_WINDOW_MS,
+    MODEL_PATH,
+    MODEL_RELOAD_INTERVAL,
+    MODELS_CONFIG,
+    OUTDIR,
+    RESULT_CACHE_MAX_ENTRIES,
+    RESULT_CACHE_TTL,
+    SCREENING_BAND,
+    SCREENING_MODEL,
+    SEGMENT_HOP,
+    SHADOW_LOG,
+    SIMILARITY_INDEX,
+    SPECTROGRAM_MODE,
+)
+from model_registry import ModelRegistry, load_router
+from result_cache import ResultCache
+from similarity_index import SimilarityIndex
 
 sys.path.append("preprocess/")
 sys.path.append("feature_extraction/")
@@ -26,8 +66,36 @@ sys.path.append("feature_extraction/")
 app = Flask(__name__)
 CORS(app)
 uploads_path = Path(OUTDIR / "uploads")
+plots_path = Path(OUTDIR / "feature_analysis/strf_plots")
+processed_path = Path(OUTDIR / "preprocess/preprocessed_audio/processed_audio")
+status_path = Path(OUTDIR / "status")
 
 strf_analyzer = STRFAnalyzer()
+# Sliding windows start on whole spectrogram frames, segments and features alike
+segment_hop = frame_aligned(SEGMENT_HOP)
+if segment_hop <= 0:
+    raise ValueError(f"SEGMENT_HOP of {SEGMENT_HOP} s is shorter than one frame")
+model_router = load_router(MODELS_CONFIG, MODEL_PATH, MODEL_RELOAD_INTERVAL)
+screening_registry = (
+    ModelRegistry(Path(SCREENING_MODEL), MODEL_RELOAD_INTERVAL)
+    if SCREENING_MODEL
+    else None
+)
+result_cache = (
+    ResultCache(
+        OUTDIR / "result_cache",
+        [plots_path, processed_path],
+        RESULT_CACHE_MAX_ENTRIES,
+        RESULT_CACHE_TTL,
+    )
+    if RESULT_CACHE_MAX_ENTRIES > 0
+    else None
+)
+# Shadow models are scored one request at a time after the response
+shadow_executor = ThreadPoolExecutor(max_workers=1)
+batchers = {}
+batchers_lock = threading.Lock()
+similarity_indexes = {}
 
 
 @app.route("/")
@@ -55,40 +123,50 @@ class Classification:
     is_success: bool
     sd_prob: float
     nsd_prob: float
+    segments_used: int
+    segments_total: int
+    screened: bool  # answered by the screening model alone
+    segments_done: int
+    final: bool  # False for the provisional results published during extraction
+    plots: list[str]  # files under /plots/<uid>/, empty when none were made
     # other fields here
 
     def into_json(self):
-        return jsonify(
-            {
-                "class": self.sd.value,
-                "classes": [c.value for c in self.classes],
-                "scores": self.scores,
-                "decision_scores": self.decision_scores,
-                "sd_decision_score": self.sd_decision_score,
-                "nsd_decision_score": self.nsd_decision_score,
-                "sd_prob": self.sd_prob,
-                "nsd_prob": self.nsd_prob,
-                "confidence_score": self.confidence_score,
-                "decision_score": self.avg_decision_score,
-                "result": self.result,
-            }
-        )
+        return jsonify(self.to_dict())
+
+    def to_dict(self):
+        return {
+            "class": self.sd.value,
+            "classes": [c.value for c in self.classes],
+            "scores": self.scores,
+            "decision_scores": self.decision_scores,
+            "sd_decision_score": self.sd_decision_score,
+            "nsd_decision_score": self.nsd_decision_score,
+            "sd_prob": self.sd_prob,
+            "nsd_prob": self.nsd_prob,
+            "confidence_score": self.confidence_score,
+            "decision_score": self.avg_decision_score,
+            "result": self.result,
+            "is_success": self.is_success,
+            "segments_used": self.segments_used,
+            "segments_total": self.segments_total,
+            "screened": self.screened,
+            "segments_done": self.segments_done,
+            "final": self.final,
+            "plots": self.plots,
+        }
 
 
 @app.route("/plots/<uuid:uid>/<path:filename>")
 def get_plot(filename, uid):
     print(f"Requesting plot: {filename}")
-    path = (Path(OUTDIR / "feature_analysis/strf_plots") / str(uid)).resolve(strict=True)
+    path = (plots_path / str(uid)).resolve(strict=True)
     return send_from_directory(path, filename)
 
 
 @app.route("/segments/<uuid:uid>")
 def Segments(uid):
-    segments_dir = (
-        Path(OUTDIR / "preprocess/preprocessed_audio/processed_audio")
-        / str(uid)
-        / "segmented_audio"
-    )
+    segments_dir = processed_path / str(uid) / "segmented_audio"
 
     # Construct an in-memory zip file
     zip_buffer = io.BytesIO()
@@ -107,6 +185,47 @@ def Segments(uid):
     )
 
 
+@app.route("/status/<uuid:uid>")
+def Status(uid):
+    try:
+        with open(status_path / f"{uid}.json") as f:
+            status = json.load(f)
+    except FileNotFoundError:
+        return jsonify({"error": "Unknown upload."}), HTTPStatus.NOT_FOUND
+
+    # the final result is handed out once
+    if status.get("final"):
+        (status_path / f"{uid}.json").unlink(missing_ok=True)
+    return jsonify(status)
+
+
+@app.route("/similar/<uuid:uid>")
+def Similar(uid):
+    k = request.args.get("k", 5, type=int)
+
+    model_name, _ = model_router.route(str(uid))
+    index = similarity_index_for(model_router.active(model_name))
+    vector = index.vector_of(uid) if index is not None else None
+    if vector is None:
+        return jsonify({"error": "Recording not indexed."}), HTTPStatus.NOT_FOUND
+
+    return jsonify(
+        {
+            "similar": [
+                {
+                    "uid": other,
+                    "distance": distance,
+                    "class": sd_class,
+                    "sd_prob": sd_prob,
+                }
+                for other, distance, sd_class, sd_prob in index.query(
+                    vector, k, exclude=uid
+                )
+            ]
+        }
+    )
+
+
 @app.route("/upload/<uuid:uid>", methods=["POST"])
 def Upload(uid):
     if "audio" not in request.files:
@@ -124,11 +243,22 @@ def Upload(uid):
         audio_file.save(file_path)
 
         wav_file = convertWAV(file_path)
-        clf = classify(wav_file, uid, noise_removal_flag)
 
+        # Answer right away, the client polls /status/<uid> for the
+        # provisional and final results
+        if request.form.get("async", "false").lower() == "true":
+            evict_statuses()
+            threading.Thread(
+                target=classify_upload,
+                args=(wav_file, uid, noise_removal_flag, True),
+                daemon=True,
+            ).start()
+            return jsonify({"status": f"/status/{uid}"}), HTTPStatus.ACCEPTED
+
+        result = classify_upload(wav_file, uid, noise_removal_flag)
         return (
-            clf.into_json(),
-            HTTPStatus.OK if clf.is_success else HTTPStatus.BAD_REQUEST,
+            jsonify(result),
+            HTTPStatus.OK if result.get("is_success", True) else HTTPStatus.BAD_REQUEST,
         )
 
     return (
@@ -137,106 +267,298 @@ def Upload(uid):
     )
 
 
-def predict_features(features, svm, pca):
+def classify_upload(wav_file, uid, noise_removal_flag, publish=False):
+    """
+    Classification JSON of an upload, from the result cache or classify.
+    With publish, the provisional results and the final one are also
+    published as the status of the upload.
+    """
+    try:
+        # Retried uploads of the same audio reuse the stored result
+        cache_key = None
+        if result_cache is not None:
+            model_name, _ = model_router.route(str(uid))
+            cache_key = result_cache.key(
+                wav_file,
+                noise_removal_flag,
+                model_router.active(model_name).version,
+                extraction_settings(),
+            )
+            cached = result_cache.get(cache_key, uid)
+            if cached is not None:
+                if publish:
+                    publish_status(uid, cached)
+                return cached
+
+        clf = classify(wav_file, uid, noise_removal_flag, publish)
+        if cache_key is not None and clf.is_success:
+            result_cache.put(cache_key, uid, clf.to_dict())
+    except Exception as e:
+        if publish:
+            publish_status(
+                uid, {"error": str(e), "final": True, "is_success": False}
+            )
+        raise
+
+    result = clf.to_dict()
+    if publish:
+        publish_status(uid, result)
+    return result
+
+
+def publish_status(uid, result):
+    """
+    Make result the current status of an upload for /status/<uid>, replacing
+    the file atomically so pollers never read a partial one.
+    """
+    status_path.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=status_path, suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(result, f)
+    os.replace(tmp, status_path / f"{uid}.json")
+
+
+def evict_statuses():
+    """
+    Remove the statuses of uploads never fetched to completion, once they
+    are older than RESULT_CACHE_TTL.
+    """
+    evict_lru(status_path, "*.json", ttl=RESULT_CACHE_TTL)
+
+
+def extraction_settings():
+    """
+    Settings besides the model that change the features a result is based on.
+    """
+    return {
+        "spectrogram_mode": SPECTROGRAM_MODE,
+        "segment_hop": segment_hop,
+        "early_exit": [EARLY_EXIT, EARLY_EXIT_CONFIDENCE, EARLY_EXIT_MIN_SEGMENTS],
+        "screening": [
+            screening_registry.active().version if screening_registry else None,
+            SCREENING_BAND,
+        ],
+    }
+
+
+def batcher_for(model):
+    """
+    Micro-batcher shared by all requests scored with this model version, or
+    None when micro-batching is disabled or the version is no longer served
+    (requests still pinned to it after a hot reload score directly).
+    Creating one for a new version closes those of versions the router no
+    longer serves.
+    """
+    if MICROBATCH_WINDOW_MS <= 0:
+        return None
+
+    # outside the lock, active() may reload a model
+    serving = {model_router.active(name).version for name in model_router.registries}
+    if model.version not in serving:
+        return None
+
+    with batchers_lock:
+        if model.version not in batchers:
+            for version in [v for v in batchers if v not in serving]:
+                batchers.pop(version).close()
+
+            batchers[model.version] = MicroBatcher(
+                lambda X: score_features(X, model.svm, model.pca, model.compiled),
+                MICROBATCH_WINDOW_MS / 1000,
+                MICROBATCH_MAX_ROWS,
+            )
+        return batchers[model.version]
+
+
+def similarity_index_for(model):
+    """
+    Similarity index of the recordings scored with this model version, or
+    None when disabled or the model has no PCA projection.
+    """
+    projection = projection_of(model.pca, model.compiled)
+    if not SIMILARITY_INDEX or projection is None:
+        return None
+
+    if model.version not in similarity_indexes:
+        similarity_indexes[model.version] = SimilarityIndex(
+            OUTDIR / "similarity_index" / model.version,
+            projection[1].shape[1],
+        )
+    return similarity_indexes[model.version]
+
+
+def index_recording(uid, features, model, clf):
+    index = similarity_index_for(model)
+    if index is None or not clf.is_success:
+        return
+
+    # Mean PCA projection of the segments
+    mean, projection = projection_of(model.pca, model.compiled)
+    vector = np.mean((normalize_features(features) - mean) @ projection, axis=0)
+    index.add(uid, vector, clf.sd.value, clf.sd_prob)
+
+
+def segment_scores(feature_norm, svm, pca, compiled=None, batcher=None):
+    """
+    SVM classes, predicted labels, decision values and SD/NSD probabilities
+    (zeros without Platt scaling) of normalized segment features, batched
+    with concurrent requests when a batcher is given.
+    """
+    if batcher is not None:
+        svm_classes, y_pred, decision, probs = batcher.submit(feature_norm)
+    else:
+        svm_classes, y_pred, decision, probs = score_features(
+            feature_norm, svm, pca, compiled
+        )
+
+    # Confidence (probability) score
+    sd_probs = np.zeros(len(feature_norm))
+    nsd_probs = np.zeros(len(feature_norm))
+    if probs is not None:
+        sd_index = np.where(svm_classes == SD_Class.POST.value)[0][0]
+        nsd_index = np.where(svm_classes == SD_Class.PRE.value)[0][0]
+        sd_probs = probs[:, sd_index]
+        nsd_probs = probs[:, nsd_index]
+
+    return svm_classes, y_pred, decision, sd_probs, nsd_probs
+
+
+def incremental_scores(model):
+    """
+    scores(features) giving (y_pred, decision, sd_probs, nsd_probs) of every
+    segment of a growing feature list, scoring only the segments added since
+    the previous call.
+    """
+    scored = []
+
+    def scores(features):
+        if len(features) > len(scored):
+            _, *new = segment_scores(
+                normalize_features(features[len(scored):]),
+                model.svm,
+                model.pca,
+                model.compiled,
+                batcher_for(model),
+            )
+            scored.extend(zip(*new))
+        return tuple(np.array(column) for column in zip(*scored[: len(features)]))
+
+    return scores
+
+
+def early_exit(model, scores=None):
+    """
+    stop() callback for feature_extract_sequential: scores the segments
+    extracted so far and stops once the probability of the majority class,
+    as carried by the adjusted confidence score, reaches
+    EARLY_EXIT_CONFIDENCE. scores is shared with other callbacks of the
+    same extraction.
+    """
+    scores = scores or incremental_scores(model)
+
+    def stop(features):
+        if len(features) < EARLY_EXIT_MIN_SEGMENTS:
+            return False
+
+        y_pred, _, sd_probs, nsd_probs = scores(features)
+        sd_counter = int(np.count_nonzero(y_pred == SD_Class.POST.value))
+        nsd_counter = len(features) - sd_counter
+        score = adjusted_confidence(
+            sd_counter, nsd_counter, np.mean(sd_probs), np.mean(nsd_probs)
+        )
+
+        if sd_counter > nsd_counter:
+            confidence = (score - 50) / 50
+        elif sd_counter < nsd_counter:
+            confidence = score / 50
+        else:
+            confidence = 0.0  # balanced, keep going
+
+        if confidence >= EARLY_EXIT_CONFIDENCE:
+            print(
+                f"Early exit after {len(features)} segments "
+                f"(adjusted confidence score {score:.2f})"
+            )
+            return True
+        return False
+
+    return stop
+
+
+def publish_progress(uid, model, segments_total):
+    """
+    stop() callback for feature_extract_sequential publishing a provisional
+    classification of the segments extracted so far, and stopping early
+    when EARLY_EXIT is set. Only the newly completed segment is scored.
+    """
+    scores = incremental_scores(model)
+    stop = early_exit(model, scores) if EARLY_EXIT else None
+
+    def progress(features):
+        prediction = prediction_from(*scores(features))
+        clf = classification_from(
+            prediction, len(features), segments_total, final=False
+        )
+        publish_status(uid, clf.to_dict())
+        return stop is not None and stop(features)
+
+    return progress
+
+
+def predict_features(features, svm, pca, compiled=None, batcher=None):
     if not features:
         print("!!!!!!!!!! Error: no features accepted !!!!!!!!!!")
         print("Make sure the audio recording length is at least 15 seconds.")
         is_success = False
-        return 0, 0, [], [], 0.0, is_success
-
-    nsd_counter = 0
-    sd_counter = 0
-    sum_nsd_prob = 0.0
-    sum_sd_prob = 0.0
-    sd_prob_scores = []
-    nsd_prob_scores = []
-    classes = []
-    sd_decision_scores = []
-    nsd_decision_scores = []
-    decision_scores = []
-    confidence_scores = []
-    avg_confidence_score = 0.0
-
-    for i, feature in enumerate(features):
-        print(f"\nProcessing feature {i + 1}")
-
-        # Flatten and normalize
-        feature_flat = np.asarray(feature).flatten()
-        feature_norm = (
-            feature_flat / np.max(np.abs(feature_flat))
-            if np.max(np.abs(feature_flat)) != 0
-            else feature_flat
+        return 0.0, 0.0, 0, 0, [], [], [], 0.0, 0.0, 0.0, 0.0, 0.0, is_success
+
+    # Flatten all segments into one matrix and normalize each row
+    feature_norm = normalize_features(features)
+
+    n_features = expected_features(svm, pca, compiled)
+    if feature_norm.shape[1] != n_features:
+        raise ValueError(
+            f"Feature mismatch! Expected {n_features}, got {feature_norm.shape[1]}."
         )
-        feature_reshaped = feature_norm.reshape(1, -1)
-
-        expected_features = pca.components_.shape[1]
-        if feature_flat.shape[0] != expected_features:
-            raise ValueError(
-                f"Feature mismatch! Expected {expected_features}, got {
-                    feature_flat.shape[0]
-                }."
-            )
 
-        # PCA transformation
-        feature_pca = pca.transform(feature_reshaped)
-
-        # Prediction
-        y_pred = svm.predict(feature_pca)
-        predicted_label = y_pred[0]
-        print(f"Predicted class for feature {i + 1}: {predicted_label}")
-        print(f"SVM classes: {svm.classes_}")
-
-        # Decision score (distance from hyperplane)
-        decision_score = abs(float(svm.decision_function(feature_pca)[0]))
-        decision_scores.append(decision_score)
-        print(f"Decision Score: {decision_score:.4f}")
-
-        # Confidence (probability) score
-        sd_prob, nsd_prob = 0.0, 0.0
-        if hasattr(svm, "predict_proba"):
-            probs = svm.predict_proba(feature_pca)[0]
-            sd_index = np.where(svm.classes_ == SD_Class.POST.value)[0][0]
-            nsd_index = np.where(svm.classes_ == SD_Class.PRE.value)[0][0]
-            sd_prob = float(probs[sd_index])
-            nsd_prob = float(probs[nsd_index])
-
-        # Output NSD and SD Probabilities
-        print(f"Non-sleep-deprived Probability Score: {nsd_prob}")
-        print(f"Sleep-deprived Probability Score: {sd_prob}")
-
-        # Assign class and count
-        if predicted_label == SD_Class.POST.value:
-            sd_counter += 1
-            classes.append(SD_Class.POST)
-            confidence_scores.append(sd_prob)
-            sd_decision_scores.append(decision_score)
-        else:
-            nsd_counter += 1
-            classes.append(SD_Class.PRE)
-            confidence_scores.append(nsd_prob)
-            nsd_decision_scores.append(decision_score)
+    # PCA transformation and SVM evaluation, once for all segments; the
+    # compiled model skips sklearn entirely
+    svm_classes, y_pred, decision, sd_probs, nsd_probs = segment_scores(
+        feature_norm, svm, pca, compiled, batcher
+    )
+    print(f"SVM classes: {svm_classes}")
 
-        sum_sd_prob += sd_prob
-        sum_nsd_prob += nsd_prob
-        sd_prob_scores.append(sd_prob)
-        nsd_prob_scores.append(nsd_prob)
+    return prediction_from(y_pred, decision, sd_probs, nsd_probs)
+
+
+def prediction_from(y_pred, decision, sd_probs, nsd_probs):
+    """
+    predict_features outcome of the per-segment scores of a recording.
+    """
+    # Decision score (distance from hyperplane)
+    decision_scores = np.abs(decision)
+
+    # Assign classes and count
+    is_sd = y_pred == SD_Class.POST.value
+    sd_counter = int(np.count_nonzero(is_sd))
+    nsd_counter = len(y_pred) - sd_counter
+    classes = [SD_Class.POST if sd else SD_Class.PRE for sd in is_sd]
+    confidence_scores = np.where(is_sd, sd_probs, nsd_probs)
+    print(f"Predicted classes: {y_pred.tolist()}")
 
     # Final calculations
-    avg_sd_prob = sum_sd_prob / len(sd_prob_scores)
-    avg_nsd_prob = sum_nsd_prob / len(nsd_prob_scores)
-    avg_decision_score = np.mean(decision_scores) if decision_scores else 0.0
-    avg_sd_decision_score = np.mean(sd_decision_scores) if sd_decision_scores else 0.0
+    avg_sd_prob = float(np.mean(sd_probs))
+    avg_nsd_prob = float(np.mean(nsd_probs))
+    avg_decision_score = np.mean(decision_scores)
+    avg_sd_decision_score = np.mean(decision_scores[is_sd]) if sd_counter else 0.0
     avg_nsd_decision_score = (
-        np.mean(nsd_decision_scores) if nsd_decision_scores else 0.0
+        np.mean(decision_scores[~is_sd]) if nsd_counter else 0.0
     )
 
     # Adjusted confidence scoring
-    if sd_counter == nsd_counter:
-        adjusted_confidence_score = 50 + (avg_sd_prob - avg_nsd_prob) * 50
-    elif sd_counter > nsd_counter:
-        adjusted_confidence_score = 50 + (avg_sd_prob * 50)
-    else:
-        adjusted_confidence_score = avg_nsd_prob * 50
+    adjusted_confidence_score = adjusted_confidence(
+        sd_counter, nsd_counter, avg_sd_prob, avg_nsd_prob
+    )
 
     # Feedback message
     if adjusted_confidence_score >= 80:
@@ -247,7 +569,7 @@ def predict_features(features, svm, pca):
         print("\nClassification: Non-sleep-deprived")
 
     # Average Confidence Score
-    avg_confidence_score = sum(confidence_scores) / len(confidence_scores)
+    avg_confidence_score = float(np.mean(confidence_scores))
 
     # Output summaries
     print(f"\nAverage SD Probability: {avg_sd_prob:.4f}")
@@ -267,8 +589,8 @@ def predict_features(features, svm, pca):
         nsd_counter,
         sd_counter,
         classes,
-        confidence_scores,
-        decision_scores,
+        confidence_scores.tolist(),
+        decision_scores.tolist(),
         avg_sd_decision_score,
         avg_nsd_decision_score,
         adjusted_confidence_score,
@@ -279,7 +601,9 @@ def predict_features(features, svm, pca):
 
 
 @profile
-def classify(audio_path: Path, uid, noise_removal_flag) -> Classification:
+def classify(
+    audio_path: Path, uid, noise_removal_flag, publish=False
+) -> Classification:
     """
     Predict the class labels for the given STM features array of 3D using the trained SVM and PCA models.
 
@@ -288,35 +612,71 @@ def classify(audio_path: Path, uid, noise_removal_flag) -> Classification:
         svm_path (str): Path to the trained SVM model (.pkl file).
         pca_path (str): Path to the trained PCA model (.pkl file).
     """
-    svm_path = Path("./updated_model/svm_pca_strf_ncomp24_2025-05-29.pkl")
+    # Models are loaded once at startup, keep this request on one version
+    model_name, shadow_names = model_router.route(str(uid))
+    model = model_router.active(model_name)
+    svm = model.svm
+    pca = model.pca
 
-    print(f"Model: {svm_path}")
+    print(f"Model: {model_name} {model.path} (version {model.version})")
 
     test_sample_path = Path("./strf_data_new.pkl")
 
-    # Load the SVM and PCA models using pickle
-    with open(svm_path, "rb") as f:
-        data = pickle.load(f)
-    svm = data["svm"]
-    pca = data["pca"]
     # Define the output directory, if necessary to be stored
-    output_dir_processed = Path(OUTDIR / "preprocess/preprocessed_audio/processed_audio") / str(
-        uid
-    )
+    output_dir_processed = processed_path / str(uid)
     output_dir_segmented = output_dir_processed / "segmented_audio"
 
-    # Preprocess
-    segments, sr = preprocess_audio(
-        audio_path, output_dir_processed, noise_removal_flag
-    )
+    if SPECTROGRAM_MODE == "recording":
+        # Preprocess, keeping the whole recording for a single filterbank pass
+        y, sr = load_preprocessed_audio(audio_path, noise_removal_flag)
+        segments = segment_audio(y, sr, output_dir_processed)
+
+        print(f"Number of segments: {len(segments)}")
+        print(f"Sampling rate: {sr} Hz")
 
-    # Print details
-    print(f"Number of segments: {len(segments)}")
-    print(f"Sampling rate: {sr} Hz")
+        features = feature_extract_recording(y, sr)
+    elif SPECTROGRAM_MODE == "sliding":
+        # Overlapping windows sharing their spectrogram frames
+        y, sr = load_preprocessed_audio(audio_path, noise_removal_flag)
+        segments = segment_audio(y, sr, output_dir_processed, hop_length=segment_hop)
 
-    # Feature Extraction
-    features = feature_extract_segments(segments, sr)
+        print(f"Number of segments: {len(segments)}")
+        print(f"Sampling rate: {sr} Hz")
+
+        features = feature_extract_sliding(y, sr, hop_length=segment_hop)
+    else:
+        # Preprocess
+        segments, sr = preprocess_audio(
+            audio_path, output_dir_processed, noise_removal_flag
+        )
+
+        # Print details
+        print(f"Number of segments: {len(segments)}")
+        print(f"Sampling rate: {sr} Hz")
+
+        # Cheap screening first, the STRF only runs when it is uncertain
+        if screening_registry is not None and segments:
+            screened = screen(segments, sr)
+            if screened is not None:
+                return screened
+
+        # Feature Extraction; when publishing, segments complete in order
+        # and a provisional result is published after each one
+        if publish:
+            features = feature_extract_sequential(
+                segments, sr, publish_progress(uid, model, len(segments))
+            )
+        elif EARLY_EXIT:
+            features = feature_extract_sequential(segments, sr, early_exit(model))
+        else:
+            features = feature_extract_segments(segments, sr)
     print("Feature Extraction Complete.")
+    print(f"Segments used: {len(features)} of {len(segments)}")
+
+    # Nothing to average, plot or index, predict_features reports the failure
+    if not features:
+        prediction = predict_features(features, svm, pca, model.compiled)
+        return classification_from(prediction, 0, len(segments))
 
     # Compute and save STRFs
     avg_scale_rate, avg_freq_rate, avg_freq_scale = strf_analyzer.compute_avg_strf(
@@ -326,8 +686,9 @@ def classify(audio_path: Path, uid, noise_removal_flag) -> Classification:
         avg_scale_rate,
         avg_freq_rate,
         avg_freq_scale,
-        Path(OUTDIR / "feature_analysis/strf_plots") / str(uid),
+        plots_path / str(uid),
     )
+    plots = sorted(path.name for path in (plots_path / str(uid)).glob("*.png"))
     print(f"Avg STRF computation and plots complete.")
 
     # test_sample = pickle.load(test_sample_path)
@@ -343,6 +704,49 @@ def classify(audio_path: Path, uid, noise_removal_flag) -> Classification:
     # test_sample = np.mean(magnitude_strf, axis=0)
     # print(test_sample["strf"])
 
+    prediction = predict_features(
+        features, svm, pca, model.compiled, batcher_for(model)
+    )
+
+    clf = classification_from(prediction, len(features), len(segments), plots=plots)
+    index_recording(uid, features, model, clf)
+
+    # Same features, other models; only logged, off the response path
+    if shadow_names:
+        shadow_executor.submit(
+            score_shadows, features, uid, model_name, model, shadow_names
+        )
+    return clf
+
+
+def screen(segments, sr):
+    """
+    Classification by the screening model, or None when its average SD
+    probability falls inside SCREENING_BAND and the full STRF pipeline has
+    to decide. No STRF plots are produced for screened recordings, their
+    response lists none.
+    """
+    screener = screening_registry.active()
+    print(f"Screening model: {screener.path} (version {screener.version})")
+
+    features = feature_extract_screening(segments, sr)
+    prediction = predict_features(
+        features, screener.svm, screener.pca, screener.compiled
+    )
+
+    avg_sd_prob = prediction[0]
+    low, high = SCREENING_BAND
+    if low < avg_sd_prob < high:
+        print(f"Screening uncertain (SD probability {avg_sd_prob:.4f}), running STRF")
+        return None
+
+    print(f"Screening settled (SD probability {avg_sd_prob:.4f})")
+    return classification_from(prediction, len(segments), len(segments), screened=True)
+
+
+def classification_from(
+    prediction, segments_used, segments_total, screened=False, final=True, plots=()
+):
     (
         avg_sd_prob,
         avg_nsd_prob,
@@ -357,18 +761,10 @@ def classify(audio_path: Path, uid, noise_removal_flag) -> Classification:
         avg_confidence_score,
         avg_decision_score,
         is_success,
-    ) = predict_features(features, svm, pca)
+    ) = prediction
 
     print(f"\nsuccess: {is_success}\n")
-    if adjusted_confidence_score == 50:
-        result_text = "The classification score is balanced."
-        sd_class = SD_Class.BALANCED
-    elif adjusted_confidence_score > 50:
-        result_text = "You are sleep-deprived."
-        sd_class = SD_Class.POST
-    else:
-        result_text = "You are non-sleep-deprived."
-        sd_class = SD_Class.PRE
+    sd_class, result_text = interpret_score(adjusted_confidence_score)
 
     return Classification(
         sd_prob=avg_sd_prob,
@@ -383,9 +779,80 @@ def classify(audio_path: Path, uid, noise_removal_flag) -> Classification:
         avg_decision_score=avg_decision_score,
         result=result_text,
         is_success=is_success,
+        segments_used=segments_used,
+        segments_total=segments_total,
+        screened=screened,
+        segments_done=segments_used,
+        final=final,
+        plots=list(plots),
     )
 
 
+def interpret_score(adjusted_confidence_score):
+    if adjusted_confidence_score == 50:
+        return SD_Class.BALANCED, "The classification score is balanced."
+    elif adjusted_confidence_score > 50:
+        return SD_Class.POST, "You are sleep-deprived."
+    else:
+        return SD_Class.PRE, "You are non-sleep-deprived."
+
+
+def score_shadows(features, uid, primary_name, primary, shadow_names):
+    """
+    Score the features already extracted for the primary model with every
+    shadow model and append one JSON line per model to SHADOW_LOG. A shadow
+    that fails (e.g. trained on a different feature layout) is logged with
+    its error and never affects the response.
+    """
+    for name in shadow_names:
+        entry = {
+            "uid": str(uid),
+            "primary": primary_name,
+            "primary_version": primary.version,
+            "model": name,
+        }
+        print(f"\nShadow model: {name}")
+        try:
+            model = model_router.active(name)
+            (
+                avg_sd_prob,
+                avg_nsd_prob,
+                pre_count,
+                post_count,
+                classes,
+                _,
+                _,
+                _,
+                _,
+                adjusted_confidence_score,
+                _,
+                avg_decision_score,
+                is_success,
+            ) = predict_features(
+                features, model.svm, model.pca, model.compiled, batcher_for(model)
+            )
+            entry.update(
+                {
+                    "version": model.version,
+                    "is_success": is_success,
+                    "class": interpret_score(adjusted_confidence_score)[0].value,
+                    "adjusted_confidence_score": float(adjusted_confidence_score),
+                    "sd_prob": avg_sd_prob,
+                    "nsd_prob": avg_nsd_prob,
+                    "pre_count": pre_count,
+                    "post_count": post_count,
+                    "classes": [c.value for c in classes],
+                    "decision_score": float(avg_decision_score),
+                }
+            )
+        except Exception as e:
+            print(f"Shadow model {name} failed: {e}")
+            entry["error"] = str(e)
+
+        with open(SHADOW_LOG, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+
+
 def convertWAV(audio: Path) -> Path:
     if audio.suffix == ".wav":
         return audio
@@ -0,0 +1,121 @@
+"""
+Nearest-neighbour index over the PCA projections of classified recordings.
+
+Each recording is represented by the mean PCA projection of its segments.
+The index of a model version is one append-only file of fixed-size
+records, each holding the float32 vector followed by its squared norm, the
+upload id, class and average SD probability. Appends take an exclusive
+lock and write a whole record at once, so every server worker can insert
+concurrently and a crash can at worst leave a truncated last record, which
+is dropped before the next append. Queries memory-map the file and scan it
+exactly; with the norms stored, all squared distances come from one
+matrix-vector product, a few milliseconds per hundred thousand recordings
+of a few dozen float32 dimensions.
+"""
+
+import fcntl
+import os
+import uuid
+from pathlib import Path
+
+import numpy as np
+
+
+def record_dtype(dim):
+    return np.dtype(
+        [
+            ("row", "<f4", (dim + 1,)),
+            ("uid", "<u8", (2,)),
+            ("sd_class", "S8"),
+            ("sd_prob", "<f4"),
+        ]
+    )
+
+
+def uid_key(uid):
+    return np.frombuffer(uuid.UUID(str(uid)).bytes, dtype="<u8")
+
+
+class SimilarityIndex:
+    def __init__(self, path: Path, dim):
+        self.path = Path(path).with_suffix(".index")
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.dim = dim
+        self.dtype = record_dtype(dim)
+
+    def add(self, uid, vector, sd_class, sd_prob):
+        record = np.zeros(1, dtype=self.dtype)
+        row = record["row"][0]
+        row[:-1] = vector
+        row[-1] = np.dot(row[:-1], row[:-1])
+        record["uid"] = uid_key(uid)
+        record["sd_class"] = sd_class.encode()
+        record["sd_prob"] = sd_prob
+
+        with open(self.path, "ab") as index_file:
+            fcntl.flock(index_file, fcntl.LOCK_EX)
+            try:
+                # drop the partial record of an append interrupted by a crash
+                size = os.fstat(index_file.fileno()).st_size
+                if size % self.dtype.itemsize:
+                    index_file.truncate(size - size % self.dtype.itemsize)
+                index_file.write(record.tobytes())
+                index_file.flush()
+            finally:
+                fcntl.flock(index_file, fcntl.LOCK_UN)
+
+    def load(self):
+        """
+        (vectors with their squared norm, metadata) of every complete entry.
+        """
+        try:
+            count = self.path.stat().st_size // self.dtype.itemsize
+        except FileNotFoundError:
+            count = 0
+        if count == 0:
+            records = np.zeros(0, self.dtype)
+        else:
+            # an entry being appended right now is not counted yet
+            records = np.memmap(self.path, dtype=self.dtype, mode="r", shape=(count,))
+        return records["row"], records
+
+    def positions(self, meta, uid):
+        uids = meta["uid"]
+        key = uid_key(uid)
+        return np.flatnonzero((uids[:, 0] == key[0]) & (uids[:, 1] == key[1]))
+
+    def vector_of(self, uid):
+        vectors, meta = self.load()
+        matches = self.positions(meta, uid)
+        if len(matches) == 0:
+            return None
+        return np.array(vectors[matches[-1], :-1])
+
+    def query(self, vector, k=5, exclude=None):
+        """
+        The k recordings closest to vector, as (uid, distance, class,
+        SD probability) tuples sorted by Euclidean distance.
+        """
+        vectors, meta = self.load()
+        q = np.asarray(vector, dtype=np.float32)
+
+        # |v - q|^2 = |v|^2 - 2 v.q + |q|^2
+        distances = vectors @ np.append(-2 * q, 1).astype(np.float32) + np.dot(q, q)
+        if exclude is not None:
+            distances[self.positions(meta, exclude)] = np.inf
+
+        k = min(k, int(np.count_nonzero(np.isfinite(distances))))
+        if k <= 0:
+            return []
+        nearest = np.argpartition(distances, k - 1)[:k]
+        nearest = nearest[np.argsort(distances[nearest])]
+
+        return [
+            (
+                str(uuid.UUID(bytes=meta["uid"][i].tobytes())),
+                float(np.sqrt(max(distances[i], 0.0))),
+                meta["sd_class"][i].decode(),
+                float(meta["sd_prob"][i]),
+            )
+            for i in nearest
+        ]
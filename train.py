@@ -0,0 +1,270 @@
+"""
+Reproducible training of the PCA + SVM model served by server.classify.
+
+STRF features are extracted once into a memory-mapped dataset in the work
+directory (reused by later runs on the same audio content with the same
+extraction parameters, and by the feature store when one is configured). A stratified test split is held out, the PCA is
+fitted once per cross-validation fold, and every (fold, C, gamma) point of
+the grid is fitted in parallel on the projected fold arrays, which workers
+memory-map read-only. The best parameters are refitted on the whole
+training split and written as the {"svm", "pca"} pickle loaded by the
+server, together with a results pickle in the format of
+updated_model/results_Strf_best.pkl.
+
+Usage:
+    python train.py DATA_DIR MODEL.pkl --results RESULTS.pkl
+
+DATA_DIR holds 15 s segment .wav files in pre/ and post/ subdirectories.
+"""
+
+import argparse
+import hashlib
+import itertools
+import json
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+from sklearn.decomposition import PCA
+from sklearn.metrics import (
+    accuracy_score,
+    balanced_accuracy_score,
+    classification_report,
+    confusion_matrix,
+)
+from sklearn.model_selection import StratifiedKFold, train_test_split
+from sklearn.svm import SVC
+
+from feature_extraction import feature_store, spectrogram_cache, utils
+from feature_extraction.run_extraction import (
+    feature_extract_segments,
+    rates_vec,
+    scales_vec,
+)
+from globals import MAX_WORKERS, OUTDIR
+from inference import normalize_features
+from profiler import profile
+
+CLASSES = ("post", "pre")
+
+
+def dataset_key(data_dir: Path, files):
+    """
+    Hash of the labelled file contents and of the extraction parameters the
+    features depend on.
+    """
+    store = feature_store.default_store()
+    params = feature_store.extraction_params(
+        None, 15, rates_vec, scales_vec, store.dtype if store else float
+    )
+    h = hashlib.sha256(spectrogram_cache.fingerprint(params).encode())
+    for path in files:
+        h.update(str(path.relative_to(data_dir)).encode())
+        h.update(hashlib.sha256(path.read_bytes()).digest())
+    return h.hexdigest()
+
+
+def build_dataset(data_dir: Path, work_dir: Path, chunk_size=64):
+    """
+    Normalized STRF features of every segment in a memory-mapped .npy, with
+    labels and the file list and dataset key (written last, marks the
+    dataset complete).
+    """
+    files = sorted(
+        path for label in CLASSES for path in (data_dir / label).glob("*.wav")
+    )
+    if not files:
+        raise SystemExit(f"No segments in {data_dir}/pre or {data_dir}/post")
+    names = [str(path.relative_to(data_dir)) for path in files]
+    key = dataset_key(data_dir, files)
+
+    files_path = work_dir / "files.json"
+    marker = json.loads(files_path.read_text()) if files_path.exists() else None
+    if isinstance(marker, dict) and marker["key"] == key:
+        print(f"Reusing extracted features: {work_dir}")
+        return
+    files_path.unlink(missing_ok=True)
+
+    features = None
+    for start in range(0, len(files), chunk_size):
+        chunk = [utils.audio_data(path) for path in files[start : start + chunk_size]]
+        sample_rates = {fs for _, fs in chunk}
+        if len(sample_rates) != 1:
+            raise ValueError(f"Mixed sample rates in {data_dir}: {sample_rates}")
+
+        rows = normalize_features(
+            feature_extract_segments([audio for audio, _ in chunk], sample_rates.pop())
+        )
+        if features is None:
+            features = np.lib.format.open_memmap(
+                work_dir / "features.npy",
+                mode="w+",
+                dtype=float,
+                shape=(len(files), rows.shape[1]),
+            )
+        features[start : start + len(rows)] = rows
+        print(f"Extracted {start + len(rows)} of {len(files)} segments")
+
+    features.flush()
+    np.save(work_dir / "labels.npy", np.array([path.parent.name for path in files]))
+    files_path.write_text(json.dumps({"key": key, "files": names}))
+
+
+def fit_fold(work_dir: Path, fold, train_idx, val_idx, n_components):
+    """
+    Fit the PCA of one fold and save the projected fold arrays.
+    """
+    X = np.load(work_dir / "features.npy", mmap_mode="r")
+    pca = PCA(n_components=n_components, random_state=42).fit(X[train_idx])
+    np.save(work_dir / f"fold{fold}_train.npy", pca.transform(X[train_idx]))
+    np.save(work_dir / f"fold{fold}_val.npy", pca.transform(X[val_idx]))
+    return fold
+
+
+def evaluate(work_dir: Path, fold, y_train, y_val, params):
+    Z_train = np.load(work_dir / f"fold{fold}_train.npy", mmap_mode="r")
+    Z_val = np.load(work_dir / f"fold{fold}_val.npy", mmap_mode="r")
+    svm = SVC(kernel="rbf", class_weight="balanced", random_state=42, **params)
+    svm.fit(Z_train, y_train)
+    return balanced_accuracy_score(y_val, svm.predict(Z_val))
+
+
+def metrics(y_true, y_pred):
+    report = classification_report(y_true, y_pred, output_dict=True, zero_division=0)
+    return {
+        "BAcc": balanced_accuracy_score(y_true, y_pred),
+        "accuracy": accuracy_score(y_true, y_pred),
+        "precision": report["weighted avg"]["precision"],
+        "recall": report["weighted avg"]["recall"],
+        "f1-score": report["weighted avg"]["f1-score"],
+        "confusion_matrix": confusion_matrix(y_true, y_pred, labels=CLASSES),
+    }
+
+
+@profile
+def train(
+    data_dir: Path,
+    model_file: Path,
+    results_file: Path,
+    work_dir: Path,
+    param_grid,
+    n_components=20,
+    folds=5,
+    test_size=0.2,
+    workers=2,
+):
+    work_dir.mkdir(parents=True, exist_ok=True)
+    build_dataset(data_dir, work_dir)
+
+    X = np.load(work_dir / "features.npy", mmap_mode="r")
+    y = np.load(work_dir / "labels.npy")
+    train_idx, test_idx = train_test_split(
+        np.arange(len(y)), test_size=test_size, stratify=y, random_state=42
+    )
+
+    splits = list(
+        StratifiedKFold(n_splits=folds, shuffle=True, random_state=42).split(
+            train_idx, y[train_idx]
+        )
+    )
+    grid = [
+        dict(zip(param_grid, values))
+        for values in itertools.product(*param_grid.values())
+    ]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        list(
+            executor.map(
+                fit_fold,
+                [work_dir] * folds,
+                range(folds),
+                [train_idx[fold_train] for fold_train, _ in splits],
+                [train_idx[fold_val] for _, fold_val in splits],
+                [n_components] * folds,
+            )
+        )
+
+        futures = {
+            (g, fold): executor.submit(
+                evaluate,
+                work_dir,
+                fold,
+                y[train_idx[fold_train]],
+                y[train_idx[fold_val]],
+                params,
+            )
+            for g, params in enumerate(grid)
+            for fold, (fold_train, fold_val) in enumerate(splits)
+        }
+        scores = np.array(
+            [[futures[g, fold].result() for fold in range(folds)] for g in range(len(grid))]
+        )
+
+    mean_scores = scores.mean(axis=1)
+    best_params = grid[int(np.argmax(mean_scores))]
+    for params, score in zip(grid, mean_scores):
+        print(f"{params}: balanced accuracy {score:.4f}")
+    print(f"Best parameters: {best_params}")
+
+    # Refit on the whole training split
+    pca = PCA(n_components=n_components, random_state=42).fit(X[train_idx])
+    svm = SVC(
+        kernel="rbf",
+        class_weight="balanced",
+        probability=True,
+        random_state=42,
+        **best_params,
+    )
+    svm.fit(pca.transform(X[train_idx]), y[train_idx])
+
+    y_test = y[test_idx]
+    y_pred = svm.predict(pca.transform(X[test_idx]))
+    results = {
+        "best_params": best_params,
+        "test_metrics": metrics(y_test, y_pred),
+        "pre_metrics": metrics(y_test[y_test == "pre"], y_pred[y_test == "pre"]),
+        "post_metrics": metrics(y_test[y_test == "post"], y_pred[y_test == "post"]),
+        "cv_results": {"params": grid, "scores": scores},
+    }
+    print(f"Test balanced accuracy: {results['test_metrics']['BAcc']:.4f}")
+
+    with open(model_file, "wb") as f:
+        pickle.dump({"svm": svm, "pca": pca}, f)
+    with open(results_file, "wb") as f:
+        pickle.dump(results, f)
+    print(f"Saved model to: {model_file}")
+    print(f"Saved results to: {results_file}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n\n")[0])
+    parser.add_argument("data_dir", type=Path)
+    parser.add_argument("model_file", type=Path)
+    parser.add_argument("--results", type=Path, required=True)
+    parser.add_argument(
+        "--work-dir", type=Path, default=Path(OUTDIR / "training"), help="dataset cache"
+    )
+    parser.add_argument("--n-components", type=int, default=20)
+    parser.add_argument("--C", type=float, nargs="+", default=[1e-3, 1, 1e3])
+    parser.add_argument("--gamma", type=float, nargs="+", default=[1e-3, 1, 1e3])
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--test-size", type=float, default=0.2)
+    parser.add_argument("--workers", type=int, default=int(MAX_WORKERS))
+    args = parser.parse_args()
+
+    train(
+        args.data_dir,
+        args.model_file,
+        args.results,
+        args.work_dir,
+        {"C": args.C, "gamma": args.gamma},
+        args.n_components,
+        args.folds,
+        args.test_size,
+        args.workers,
+    )
+
+
+if __name__ == "__main__":
+    main()